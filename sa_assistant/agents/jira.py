@@ -1,12 +1,25 @@
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List
 from agents import Agent, function_tool, RunContextWrapper
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
-from jira import JIRA
 from dotenv import load_dotenv
 import openai
-from sa_assistant.tools.jira import get_tickets
+from sa_assistant.integrations.jira import JiraAPI, get_jira_api
+from sa_assistant.integrations.jira_mirror import UnsupportedQuery, get_jira_mirror
+from sa_assistant.tools.jira import (
+    find_tickets_by_request,
+    get_sprint_capacity,
+    get_tickets,
+)
+from sa_assistant.ticket_content import (
+    TicketComment,
+    build_ticket_content,
+    is_bot_author,
+)
+from .. import resilience
 from ..context import AssistantContext, JiraContext
+from ..executors import run_blocking
+from ..progress import report_progress
 
 load_dotenv()
 
@@ -19,7 +32,12 @@ async def analyze_ticket_content_with_ai(
     Uses the model specified in config.yaml.
     """
     print(f"Analyzing ticket content with model: {model}")
-    client = openai.AsyncOpenAI(api_key=openai_api_key)
+    # Retries and timeouts come from the "openai" resilience policy
+    client = openai.AsyncOpenAI(
+        api_key=openai_api_key,
+        max_retries=0,
+        timeout=resilience.get_timeout("openai"),
+    )
 
     prompt = f"""
     Analyze the following JIRA ticket content (including description and comments) and determine:
@@ -53,7 +71,9 @@ async def analyze_ticket_content_with_ai(
     """
 
     try:
-        response = await client.chat.completions.create(
+        response = await resilience.acall(
+            "openai",
+            client.chat.completions.create,
             model=model,
             messages=[
                 {
@@ -77,18 +97,97 @@ async def analyze_ticket_content_with_ai(
             "blocker": {
                 "detected": False,
                 "confidence": 0,
-                "explanation": "AI analysis failed",
+                "explanation": f"AI analysis failed: {e}",
                 "key_phrases": [],
             },
             "decision": {
                 "detected": False,
                 "confidence": 0,
-                "explanation": "AI analysis failed",
+                "explanation": f"AI analysis failed: {e}",
                 "key_phrases": [],
             },
         }
 
 
+def _load_board_tickets(
+    jira_context: JiraContext, jira_api: JiraAPI, jql: str
+) -> List[Dict[str, Any]]:
+    """
+    Load the tickets to analyze, with their description and comments. The local
+    mirror is used when it can answer the query, otherwise Jira is queried.
+    """
+    try:
+        issues = get_jira_mirror(jira_context).query(jql, limit=50)
+        return [
+            {
+                "key": issue.key,
+                "summary": issue.summary,
+                "description": issue.description or "",
+                "comments": [
+                    TicketComment(
+                        author=c["author"],
+                        body=c["body"],
+                        is_bot=is_bot_author(c["author"], c.get("account_type")),
+                    )
+                    for c in json.loads(issue.comments)
+                ],
+                "status": issue.status,
+                "assignee": issue.assignee or "Unassigned",
+                "priority": issue.priority or "Unknown",
+            }
+            for issue in issues
+        ]
+    except UnsupportedQuery:
+        pass
+    except Exception as e:
+        print(f"Error querying the Jira mirror, falling back to Jira: {e}")
+
+    tickets = []
+    # Comments are loaded per issue below, so only the key is needed here
+    for issue in jira_api.search_issues(jql, fields=["summary"], limit=50):
+        # Get full issue details including comments
+        full_issue = resilience.call(
+            "jira", jira_api.client.issue, issue.key, expand="comments"
+        )
+
+        comments = []
+        if hasattr(full_issue.fields, "comment") and full_issue.fields.comment:
+            for comment in full_issue.fields.comment.comments:
+                author = getattr(comment, "author", None)
+                author_name = getattr(author, "displayName", "") or ""
+                comments.append(
+                    TicketComment(
+                        author=author_name,
+                        body=comment.body or "",
+                        is_bot=is_bot_author(
+                            author_name, getattr(author, "accountType", None)
+                        ),
+                    )
+                )
+
+        tickets.append(
+            {
+                "key": full_issue.key,
+                "summary": full_issue.fields.summary or "",
+                "description": full_issue.fields.description or "",
+                "comments": comments,
+                "status": full_issue.fields.status.name,
+                "assignee": (
+                    full_issue.fields.assignee.displayName
+                    if full_issue.fields.assignee
+                    else "Unassigned"
+                ),
+                "priority": (
+                    full_issue.fields.priority.name
+                    if hasattr(full_issue.fields, "priority")
+                    and full_issue.fields.priority
+                    else "Unknown"
+                ),
+            }
+        )
+    return tickets
+
+
 @function_tool
 async def good_morning(ctx: RunContextWrapper[AssistantContext]) -> Dict[str, Any]:
     """
@@ -106,12 +205,10 @@ async def good_morning(ctx: RunContextWrapper[AssistantContext]) -> Dict[str, An
         else ["CRE"]
     )
     print(f"Running good morning analysis for boards: {boards}")
+    model = ctx.context.openai_model or "gpt-4o-mini"
 
     try:
-        jira = JIRA(
-            server=ctx.context.jira.base_url,
-            basic_auth=(ctx.context.jira.api_email, ctx.context.jira.api_key),
-        )
+        jira_api = get_jira_api(ctx.context.jira)
     except Exception as e:
         print(f"Error connecting to JIRA: {e}")
         return {"error": "Failed to connect to JIRA"}
@@ -134,27 +231,23 @@ async def good_morning(ctx: RunContextWrapper[AssistantContext]) -> Dict[str, An
         print(f"JQL query: {jql_query}")
 
         try:
-            issues = jira.search_issues(jql_query, expand="comments", maxResults=50)
+            tickets = await run_blocking(
+                "jira", _load_board_tickets, ctx.context.jira, jira_api, jql_query
+            )
 
-            for issue in issues:
-                print(f"Analyzing issue: {issue.key}")
+            for ticket in tickets:
+                print(f"Analyzing issue: {ticket['key']}")
                 results["summary"]["total_tickets_analyzed"] += 1
 
-                # Get full issue details including comments
-                full_issue = jira.issue(issue.key, expand="comments")
-
-                # Combine all text content for analysis
-                all_text = []
-                all_text.append(full_issue.fields.summary or "")
-                all_text.append(full_issue.fields.description or "")
-
-                # Get comments
-                if hasattr(full_issue.fields, "comment") and full_issue.fields.comment:
-                    for comment in full_issue.fields.comment.comments:
-                        comment_body = comment.body or ""
-                        all_text.append(comment_body)
-
-                combined_text = " ".join(all_text)
+                # Combine the text content for analysis, bounded by the token budget
+                combined_text = build_ticket_content(
+                    ticket["summary"],
+                    ticket["description"],
+                    ticket["comments"],
+                    model=model,
+                    token_budget=ctx.context.jira.analysis_token_budget,
+                    max_comments=ctx.context.jira.analysis_max_comments,
+                )
 
                 # Use AI to analyze for blockers and decisions
                 if (
@@ -163,7 +256,7 @@ async def good_morning(ctx: RunContextWrapper[AssistantContext]) -> Dict[str, An
                     ai_analysis = await analyze_ticket_content_with_ai(
                         combined_text,
                         ctx.context.openai_api_key,
-                        ctx.context.openai_model or "gpt-4o-mini",
+                        model,
                     )
 
                     blocker_detected = ai_analysis.get("blocker", {}).get(
@@ -198,29 +291,37 @@ async def good_morning(ctx: RunContextWrapper[AssistantContext]) -> Dict[str, An
 
                         results["blockers_and_decisions"].append(
                             {
-                                "key": full_issue.key,
-                                "summary": full_issue.fields.summary,
-                                "status": full_issue.fields.status.name,
-                                "assignee": (
-                                    full_issue.fields.assignee.displayName
-                                    if full_issue.fields.assignee
-                                    else "Unassigned"
-                                ),
+                                "key": ticket["key"],
+                                "summary": ticket["summary"],
+                                "status": ticket["status"],
+                                "assignee": ticket["assignee"],
                                 "board": board,
                                 "type": item_type,
                                 "ai_analysis": analysis_details,
-                                "priority": (
-                                    full_issue.fields.priority.name
-                                    if hasattr(full_issue.fields, "priority")
-                                    and full_issue.fields.priority
-                                    else "Unknown"
-                                ),
-                                "url": f"{ctx.context.jira.base_url}/browse/{full_issue.key}",
+                                "priority": ticket["priority"],
+                                "url": f"{ctx.context.jira.base_url}/browse/{ticket['key']}",
                             }
                         )
 
+            # Each board is reported as soon as it is done, the client does not
+            # have to wait for the whole analysis
+            flagged = [
+                item
+                for item in results["blockers_and_decisions"]
+                if item["board"] == board
+            ]
+            report_progress(
+                f"{board}: {len(tickets)} tickets analyzed, "
+                f"{len(flagged)} need attention"
+                + "".join(
+                    f"\n- {item['key']} ({', '.join(item['type'])}): {item['summary']}"
+                    for item in flagged
+                )
+            )
+
         except Exception as e:
             print(f"Error analyzing board {board}: {e}")
+            report_progress(f"{board}: analysis failed ({e})")
             continue
 
     return results
@@ -273,7 +374,7 @@ Examples:
 When you receive a request:
 1. Understand what the user wants
 2. Generate the appropriate JQL query
-3. Use the get_tickets function with your generated query
+3. Use the get_tickets function with your generated query, passing the user's original request as `request`
 4. Explain what the query will return
 
 Always provide a clear explanation of what the query will return.
@@ -286,11 +387,13 @@ jira_agent = Agent[JiraContext](
     name="Ticketing agent",
     instructions=f"""{RECOMMENDED_PROMPT_PREFIX}
 You are a helpful assistant that can interact with everything related to tickets.
-First, use the JQL translation agent to convert the user's request into a JQL query.
+First, call find_tickets_by_request with the user's request. If it returns a hit, answer using those tickets.
+Otherwise, use the JQL translation agent to convert the user's request into a JQL query.
 Then, use the get_tickets function with that query to fetch the relevant tickets.
+For questions about story points, capacity, load or backlog size, use get_sprint_capacity instead of fetching the tickets.
 If the customer asks a question that is not related to tickets, transfer back to the triage agent.
 """,
-    tools=[get_tickets, good_morning],
+    tools=[find_tickets_by_request, get_tickets, get_sprint_capacity, good_morning],
     handoffs=[jql_agent],
 )
 
@@ -1,6 +1,6 @@
 from agents import Agent
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
-from sa_assistant.tools.slack import send_message
+from sa_assistant.tools.slack import send_message, send_messages
 
 slack_agent = Agent(
     name="Slack agent",
@@ -9,5 +9,6 @@ You are an agent specialized in operating with Slack.
 """,
     tools=[
         send_message,
+        send_messages,
     ],
 )
@@ -0,0 +1,370 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import Column, LargeBinary, delete
+from sqlmodel import SQLModel, Field
+
+from .db import get_session
+
+
+class CachedResponse(SQLModel, table=True):
+    """
+    A response of an integration method, persisted so it survives restarts.
+    """
+
+    cache: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    value: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    stored_at: float
+
+
+_MISSING = object()
+
+
+def _key_part(value: Any) -> str:
+    # Integration instances are created per tool call, so they are identified by
+    # their cache_scope (e.g. the account they use) rather than their identity
+    if hasattr(value, "cache_scope"):
+        return f"{type(value).__qualname__}:{value.cache_scope}"
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    if type(value).__repr__ is object.__repr__:
+        return type(value).__qualname__
+    return repr(value)
+
+
+def make_key(func: Callable, args: Tuple, kwargs: Dict) -> str:
+    """
+    Normalize a call into a key. Hashed so credentials in the arguments are
+    never stored.
+    """
+    parts = [func.__module__, func.__qualname__]
+    parts += [_key_part(a) for a in args]
+    parts += [f"{k}={_key_part(v)}" for k, v in sorted(kwargs.items())]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two level cache for the responses of an integration method: an in-memory LRU
+    in front of the CachedResponse table.
+
+    Entries are fresh for ttl seconds. For stale_ttl more seconds they are still
+    served while a refresh runs in the background (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        maxsize: int = 256,
+        stale_ttl: float = 0,
+        persist: bool = True,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.persist = persist
+        self._entries: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._sets = 0
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "load_seconds": 0.0,
+        }
+
+    def _record(self, counter: str, value: float = 1):
+        with self._lock:
+            self.stats[counter] += value
+
+    def _load_persisted(self, key: str) -> Optional[Tuple[Any, float]]:
+        if not self.persist:
+            return None
+        with get_session() as session:
+            row = session.get(CachedResponse, (self.name, key))
+            if row is None:
+                return None
+            try:
+                return pickle.loads(row.value), row.stored_at
+            except Exception:
+                return None
+
+    def get(self, key: str) -> Tuple[Any, bool]:
+        """
+        Return (value, is_stale), or (_MISSING, False) if there is nothing usable.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._load_persisted(key)
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            return _MISSING, False
+
+        value, stored_at = entry
+        age = time.time() - stored_at
+        if age < self.ttl:
+            return value, False
+        if age < self.ttl + self.stale_ttl:
+            return value, True
+        return _MISSING, False
+
+    def _remember(self, key: str, value: Any, stored_at: float):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any):
+        stored_at = time.time()
+        self._remember(key, value, stored_at)
+        if not self.persist:
+            return
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            # Responses that cannot be pickled are only kept in memory
+            return
+        with get_session() as session:
+            session.merge(
+                CachedResponse(
+                    cache=self.name, key=key, value=data, stored_at=stored_at
+                )
+            )
+            self._sets += 1
+            if self._sets % 100 == 0:
+                session.exec(
+                    delete(CachedResponse).where(
+                        CachedResponse.cache == self.name,
+                        CachedResponse.stored_at
+                        < stored_at - self.ttl - self.stale_ttl,
+                    )
+                )
+            session.commit()
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        Drop one entry, or every entry of the cache if no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        if not self.persist:
+            return
+        statement = delete(CachedResponse).where(CachedResponse.cache == self.name)
+        if key is not None:
+            statement = statement.where(CachedResponse.key == key)
+        with get_session() as session:
+            session.exec(statement)
+            session.commit()
+
+    def _start_refresh(self, key: str) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _end_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["size"] = len(self._entries)
+        stats["hit_rate"] = (
+            (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        )
+        stats["avg_load_ms"] = (
+            stats["load_seconds"] * 1000 / stats["loads"] if stats["loads"] else 0.0
+        )
+        return stats
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, **options) -> ResponseCache:
+    """
+    Get the cache with the given name, creating it with the options on first use.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = ResponseCache(name, **options)
+        return _caches[name]
+
+
+def invalidate_cache(name: str):
+    """
+    Drop every entry of the named cache, in memory and in the database.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate()
+        return
+    with get_session() as session:
+        session.exec(delete(CachedResponse).where(CachedResponse.cache == name))
+        session.commit()
+
+
+def get_cache_stats() -> Dict[str, Dict[str, float]]:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.get_stats() for cache in caches}
+
+
+def cached(
+    name: str,
+    ttl: float,
+    maxsize: int = 256,
+    stale_ttl: float = 0,
+    persist: bool = True,
+):
+    """
+    Cache the responses of a read-only function or method, sync or async.
+
+        @cached("google.calendar.events", ttl=120, stale_ttl=600)
+        def get_events(self, ...): ...
+    """
+    cache = get_cache(
+        name, ttl=ttl, maxsize=maxsize, stale_ttl=stale_ttl, persist=persist
+    )
+
+    def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+
+            async def load_async(key: str, args, kwargs):
+                started = time.perf_counter()
+                try:
+                    value = await func(*args, **kwargs)
+                except Exception:
+                    cache._record("load_errors")
+                    raise
+                cache._record("loads")
+                cache._record("load_seconds", time.perf_counter() - started)
+                # None usually means "not found" or a swallowed error
+                if value is not None:
+                    cache.set(key, value)
+                return value
+
+            async def refresh_async(key: str, args, kwargs):
+                try:
+                    await load_async(key, args, kwargs)
+                except Exception as e:
+                    print(f"Error refreshing cache {name}: {e}")
+                finally:
+                    cache._end_refresh(key)
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(func, args, kwargs)
+                value, is_stale = cache.get(key)
+                if value is _MISSING:
+                    cache._record("misses")
+                    return await load_async(key, args, kwargs)
+                if is_stale:
+                    cache._record("stale_hits")
+                    if cache._start_refresh(key):
+                        asyncio.create_task(refresh_async(key, args, kwargs))
+                else:
+                    cache._record("hits")
+                return value
+
+            async_wrapper.cache = cache
+            return async_wrapper
+
+        def load(key: str, args, kwargs):
+            started = time.perf_counter()
+            try:
+                value = func(*args, **kwargs)
+            except Exception:
+                cache._record("load_errors")
+                raise
+            cache._record("loads")
+            cache._record("load_seconds", time.perf_counter() - started)
+            if value is not None:
+                cache.set(key, value)
+            return value
+
+        def refresh(key: str, args, kwargs):
+            try:
+                load(key, args, kwargs)
+            except Exception as e:
+                print(f"Error refreshing cache {name}: {e}")
+            finally:
+                cache._end_refresh(key)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(func, args, kwargs)
+            value, is_stale = cache.get(key)
+            if value is _MISSING:
+                cache._record("misses")
+                return load(key, args, kwargs)
+            if is_stale:
+                cache._record("stale_hits")
+                if cache._start_refresh(key):
+                    threading.Thread(
+                        target=refresh, args=(key, args, kwargs), daemon=True
+                    ).start()
+            else:
+                cache._record("hits")
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*names: str):
+    """
+    Clear the named caches after the decorated write method succeeds.
+    """
+
+    def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                result = await func(*args, **kwargs)
+                for name in names:
+                    invalidate_cache(name)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            for name in names:
+                invalidate_cache(name)
+            return result
+
+        return wrapper
+
+    return decorator
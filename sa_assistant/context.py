@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 
 
 class JiraContext(BaseModel):
@@ -10,6 +10,36 @@ class JiraContext(BaseModel):
         default=["GROW"],
         description="List of JIRA boards to analyze for good morning summary",
     )
+    story_points_field: str = Field(
+        default="customfield_10708",
+        description="The custom field holding the story points of a ticket",
+    )
+    sprint_field: str = Field(
+        default="customfield_10020",
+        description="The custom field holding the sprints of a ticket",
+    )
+    mirror_max_age: int = Field(
+        default=300,
+        description="Seconds the local ticket mirror can be used before re-syncing",
+    )
+    mirror_seed_days: int = Field(
+        default=90,
+        description="Days of ticket history loaded when the local mirror is seeded",
+    )
+    max_results: int = Field(
+        default=500, description="Maximum number of tickets returned by a search"
+    )
+    page_size: int = Field(
+        default=100, description="Number of tickets fetched per search request"
+    )
+    analysis_token_budget: int = Field(
+        default=3000,
+        description="Maximum number of tokens of ticket content sent to the AI analysis",
+    )
+    analysis_max_comments: int = Field(
+        default=10,
+        description="Maximum number of recent comments included in the AI analysis",
+    )
 
 
 class CalendarContext(BaseModel):
@@ -18,11 +48,83 @@ class CalendarContext(BaseModel):
 
 class SlackContext(BaseModel):
     api_token: str
+    directory_refresh_interval: int = Field(
+        default=3600, description="Seconds between background Slack directory syncs"
+    )
+    history_channels: List[str] = Field(
+        default=[],
+        description="Channels (#name or ID) whose history is ingested into the vector store",
+    )
+    history_seed_days: int = Field(
+        default=30,
+        description="Days of history read the first time a channel is ingested",
+    )
+    history_thread_window_days: int = Field(
+        default=7, description="Days during which threads are checked for new replies"
+    )
 
 
 class AsanaContext(BaseModel):
     api_token: str
     team_id: str
+    projects_ttl: int = Field(
+        default=900, description="Seconds before the team's projects are refreshed"
+    )
+    tasks_max_age: int = Field(
+        default=300,
+        description="Seconds the local task mirror can be used before re-syncing",
+    )
+
+
+class ServerContext(BaseModel):
+    host: str = Field(default="127.0.0.1", description="Host the HTTP server binds to")
+    port: int = Field(default=8000, description="Port the HTTP server listens on")
+    tool_concurrency: int = Field(
+        default=4, description="Calls of each tool that can run at the same time"
+    )
+    tool_limits: Dict[str, int] = Field(
+        default={}, description="Per-tool overrides of tool_concurrency"
+    )
+    shutdown_timeout: int = Field(
+        default=30, description="Seconds in-flight calls get to finish on shutdown"
+    )
+    job_concurrency: int = Field(
+        default=2, description="Background jobs that can run at the same time"
+    )
+    job_retention_hours: float = Field(
+        default=24, description="Hours the result of a finished job is kept"
+    )
+    job_lease_seconds: float = Field(
+        default=60,
+        description="Seconds after which the jobs of a server process that "
+        "stopped renewing them are taken over by another one",
+    )
+    instrumentation_dir: str | None = Field(
+        default=None,
+        description="Directory where stats.json and the spans of every run "
+        "(spans.jsonl, OTLP/JSON) are written",
+    )
+
+
+class VectorStoreContext(BaseModel):
+    persist_directory: str = Field(
+        default=".vector_store", description="Where the collections are stored"
+    )
+    embedding_model: str = Field(
+        default="all-MiniLM-L6-v2", description="SentenceTransformer model name"
+    )
+    device: str | None = Field(
+        default=None, description="cpu, cuda, mps... Picked automatically if unset"
+    )
+    batch_size: int = Field(default=64, description="Texts embedded per forward pass")
+    num_threads: int | None = Field(
+        default=None, description="Threads torch uses for CPU inference"
+    )
+    warm_up: bool = Field(
+        default=False,
+        description="Load the embedding model when the server starts instead of "
+        "on the first search",
+    )
 
 
 class AssistantOutput(BaseModel):
@@ -40,3 +142,5 @@ class AssistantContext(BaseModel):
     openai_model: str | None = Field(
         default="o4-mini", description="The OpenAI model to use"
     )
+    server: ServerContext = Field(default_factory=ServerContext)
+    vector_store: VectorStoreContext = Field(default_factory=VectorStoreContext)
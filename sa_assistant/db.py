@@ -1,7 +1,41 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
 from sqlmodel import create_engine, SQLModel, Session
 
 _engine_instance = None
 _models_imported = False
+_current_session: ContextVar[Session | None] = ContextVar(
+    "current_session", default=None
+)
+
+# Applied to every new SQLite connection. WAL lets readers run while a sync job
+# writes, and busy_timeout makes writers wait for each other instead of failing
+# with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _create_indexes(engine):
+    # create_all skips existing tables, so indexes added to their models later
+    # have to be created on their own
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 
 def get_engine(database_url: str = "sqlite:///app.db"):
@@ -9,8 +43,17 @@ def get_engine(database_url: str = "sqlite:///app.db"):
     global _engine_instance, _models_imported
 
     if _engine_instance is None:
-        _engine_instance = create_engine(database_url, echo=False)
+        is_sqlite = database_url.startswith("sqlite")
+        _engine_instance = create_engine(
+            database_url,
+            echo=False,
+            # Pooled connections are shared by the tools and the sync threads
+            connect_args={"check_same_thread": False} if is_sqlite else {},
+        )
+        if is_sqlite and ":memory:" not in database_url:
+            event.listen(_engine_instance, "connect", _set_sqlite_pragmas)
         SQLModel.metadata.create_all(_engine_instance)
+        _create_indexes(_engine_instance)
 
     return _engine_instance
 
@@ -18,3 +61,28 @@ def get_engine(database_url: str = "sqlite:///app.db"):
 def get_session() -> Session:
     """Get a new database session"""
     return Session(get_engine())
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Transactional scope around a series of operations. Nested scopes reuse the
+    session (and connection) of the outermost one, which commits when it exits
+    and rolls everything back on error.
+    """
+    session = _current_session.get()
+    if session is not None:
+        yield session
+        return
+
+    session = Session(get_engine(), expire_on_commit=False)
+    token = _current_session.set(session)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _current_session.reset(token)
+        session.close()
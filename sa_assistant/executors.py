@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Threads per integration. Each integration gets its own pool, so a slow Drive
+# download cannot take the threads a Jira search needs.
+POOL_SIZES = {
+    "google": 8,
+    "jira": 8,
+    "asana": 8,
+    "slack": 4,
+    "database": 4,
+}
+DEFAULT_POOL_SIZE = 4
+
+
+class IntegrationPool:
+    """
+    Thread pool for the blocking calls of one integration, with saturation
+    counters: how many calls run, how many wait for a thread and for how long.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"{name}-pool"
+        )
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "active": 0,
+            "queued": 0,
+            "peak_active": 0,
+            "peak_queued": 0,
+            "wait_seconds": 0.0,
+            "run_seconds": 0.0,
+        }
+
+    def _update(self, **changes):
+        with self._lock:
+            for counter, value in changes.items():
+                self.stats[counter] += value
+            self.stats["peak_active"] = max(
+                self.stats["peak_active"], self.stats["active"]
+            )
+            self.stats["peak_queued"] = max(
+                self.stats["peak_queued"], self.stats["queued"]
+            )
+
+    def _run(self, submitted_at: float, context: contextvars.Context, func, args):
+        started_at = time.monotonic()
+        self._update(queued=-1, active=1, wait_seconds=started_at - submitted_at)
+        try:
+            result = context.run(func, *args)
+        except BaseException:
+            self._update(failed=1)
+            raise
+        finally:
+            self._update(active=-1, run_seconds=time.monotonic() - started_at)
+        self._update(completed=1)
+        return result
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        context = contextvars.copy_context()
+        self._update(submitted=1, queued=1)
+        future = self.executor.submit(
+            self._run,
+            time.monotonic(),
+            context,
+            functools.partial(func, **kwargs),
+            args,
+        )
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Calls still waiting for a thread are dropped, running ones finish
+            # in the background and their result is discarded
+            if future.cancel():
+                self._update(queued=-1, cancelled=1)
+            raise
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["max_workers"] = self.max_workers
+        stats["utilization"] = stats["active"] / self.max_workers
+        stats["saturated"] = stats["active"] >= self.max_workers and stats["queued"] > 0
+        started = stats["completed"] + stats["failed"]
+        stats["avg_wait_ms"] = (
+            stats["wait_seconds"] * 1000 / started if started else 0.0
+        )
+        return stats
+
+
+_pools: Dict[str, IntegrationPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> IntegrationPool:
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = IntegrationPool(
+                name, POOL_SIZES.get(name, DEFAULT_POOL_SIZE)
+            )
+        return _pools[name]
+
+
+async def run_blocking(integration: str, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking call in the thread pool of the integration, with the caller's
+    context variables, and await its result without blocking the event loop.
+
+        events = await run_blocking("google", api.get_events, ...)
+    """
+    return await get_pool(integration).run(func, *args, **kwargs)
+
+
+def get_pool_stats() -> Dict[str, Dict[str, float]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.get_stats() for pool in pools}
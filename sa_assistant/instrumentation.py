@@ -0,0 +1,358 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from agents import Agent, RunContextWrapper, RunHooks, Tool
+
+# Upper bounds of the latency buckets, in milliseconds
+LATENCY_BUCKETS_MS = [
+    1,
+    2,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+    60000,
+    120000,
+]
+MAX_RECENT_SPANS = 2000
+
+# The run (trace) and MCP tool the current code runs for, so the upstream calls
+# of a tool are attributed to it
+_current_trace: ContextVar[Optional[Dict[str, str]]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets. Percentiles are estimated as the upper
+    bound of the bucket they fall in.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, value_ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(LATENCY_BUCKETS_MS[index], self.max)
+                return self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+        }
+
+
+class Span:
+    """
+    A timed operation of a run: the run itself, an LLM turn, a handoff, a tool
+    call or an upstream call of an integration.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        started_at: float,
+        duration_ms: float,
+        attributes: Dict[str, Any],
+        trace: Optional[Dict[str, str]],
+    ):
+        self.kind = kind
+        self.name = name
+        self.started_at = started_at
+        self.duration_ms = duration_ms
+        self.attributes = attributes
+        self.trace_id = trace["trace_id"] if trace else None
+        self.tool = trace["tool"] if trace else None
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "tool": self.tool,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            **self.attributes,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        start = int(self.started_at * 1e9)
+        attributes = {"span.kind": self.kind, **self.attributes}
+        if self.tool:
+            attributes["mcp.tool"] = self.tool
+        return {
+            "traceId": self.trace_id or "0" * 32,
+            "spanId": self.span_id,
+            "name": f"{self.kind} {self.name}",
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(self.duration_ms * 1e6)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in attributes.items()
+            ],
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_tokens: Dict[str, Dict[str, int]] = {}
+_recent: deque = deque(maxlen=MAX_RECENT_SPANS)
+
+
+def payload_size(value: Any) -> Optional[int]:
+    """Size of a payload in bytes for text and binary, in items for collections"""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, tuple, dict, set)):
+        return len(value)
+    return None
+
+
+def record_span(
+    kind: str,
+    name: str,
+    started_at: float,
+    duration_ms: float,
+    **attributes: Any,
+):
+    """
+    Record a finished span. started_at is a wall clock timestamp (time.time()).
+    """
+    trace = _current_trace.get()
+    span = Span(kind, name, started_at, duration_ms, attributes, trace)
+    with _lock:
+        _recent.append(span)
+        for key in (f"{kind}:{name}", f"{kind}:*"):
+            _histograms.setdefault(key, Histogram()).add(duration_ms)
+        if span.tool:
+            _histograms.setdefault(f"tool:{span.tool}/{kind}", Histogram()).add(
+                duration_ms
+            )
+        if "input_tokens" in attributes:
+            tokens = _tokens.setdefault(
+                span.tool or name,
+                {"requests": 0, "input_tokens": 0, "output_tokens": 0},
+            )
+            tokens["requests"] += attributes.get("requests", 0)
+            tokens["input_tokens"] += attributes["input_tokens"]
+            tokens["output_tokens"] += attributes.get("output_tokens", 0)
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time the enclosed block as a span. Attributes can be added to the yielded
+    dict, e.g. the size of the response.
+
+        with span("http", "jira.search_issues") as attributes:
+            issues = ...
+            attributes["response_size"] = len(issues)
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(
+            kind, name, started_at, (time.perf_counter() - started) * 1000, **attributes
+        )
+
+
+@contextmanager
+def trace(tool: str) -> Iterator[str]:
+    """Attribute the spans recorded in the block to a run of the MCP tool"""
+    trace_id = uuid.uuid4().hex
+    token = _current_trace.set({"trace_id": trace_id, "tool": tool})
+    try:
+        with span("run", tool):
+            yield trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+class InstrumentationHooks(RunHooks):
+    """
+    Run hooks recording a span per LLM turn (with its token usage), handoff and
+    tool call. One instance per run.
+
+    The SDK has no hook around model calls, so an LLM turn is the time between
+    the start of an agent or the end of its tools and the next tool call or
+    final output, and its usage is the usage the run gained meanwhile.
+    """
+
+    def __init__(self):
+        self._turn_started = time.perf_counter()
+        self._turn_started_at = time.time()
+        self._usage = (0, 0, 0)
+        self._tools: Dict[str, List[float]] = {}
+        self._running_tools = 0
+
+    def _start_turn(self):
+        self._turn_started = time.perf_counter()
+        self._turn_started_at = time.time()
+
+    def _end_turn(self, context: RunContextWrapper, agent: Agent):
+        usage = context.usage
+        requests, input_tokens, output_tokens = self._usage
+        self._usage = (usage.requests, usage.input_tokens, usage.output_tokens)
+        record_span(
+            "llm",
+            agent.name,
+            self._turn_started_at,
+            (time.perf_counter() - self._turn_started) * 1000,
+            requests=usage.requests - requests,
+            input_tokens=usage.input_tokens - input_tokens,
+            output_tokens=usage.output_tokens - output_tokens,
+            # Agents without a model of their own use the run's model
+            **({"model": str(agent.model)} if agent.model else {}),
+        )
+
+    async def on_agent_start(self, context: RunContextWrapper, agent: Agent):
+        self._start_turn()
+
+    async def on_agent_end(self, context: RunContextWrapper, agent: Agent, output):
+        self._end_turn(context, agent)
+
+    async def on_handoff(
+        self, context: RunContextWrapper, from_agent: Agent, to_agent: Agent
+    ):
+        record_span(
+            "handoff",
+            f"{from_agent.name} -> {to_agent.name}",
+            time.time(),
+            0.0,
+        )
+
+    async def on_tool_start(self, context: RunContextWrapper, agent: Agent, tool: Tool):
+        # The tools of a turn start together, the turn ends with the first one
+        if self._running_tools == 0:
+            self._end_turn(context, agent)
+        self._running_tools += 1
+        self._tools.setdefault(tool.name, []).append(time.perf_counter())
+
+    async def on_tool_end(
+        self, context: RunContextWrapper, agent: Agent, tool: Tool, result: str
+    ):
+        started = self._tools[tool.name].pop(0)
+        duration_ms = (time.perf_counter() - started) * 1000
+        record_span(
+            "tool",
+            tool.name,
+            time.time() - duration_ms / 1000,
+            duration_ms,
+            agent=agent.name,
+            output_size=payload_size(result) or 0,
+        )
+        self._running_tools -= 1
+        if self._running_tools == 0:
+            self._start_turn()
+
+
+def get_instrumentation_stats() -> Dict[str, Any]:
+    """
+    Latency histograms per span kind and name (kind:*, e.g. http:*, aggregates a
+    kind, tool:<tool>/<kind> the spans of a tool) and token usage per tool.
+    """
+    with _lock:
+        latencies = {key: h.summary() for key, h in sorted(_histograms.items())}
+        tokens = {tool: dict(usage) for tool, usage in _tokens.items()}
+    return {"latencies": latencies, "tokens": tokens}
+
+
+def get_recent_spans(trace_id: Optional[str] = None) -> List[Span]:
+    with _lock:
+        spans = list(_recent)
+    if trace_id is not None:
+        spans = [s for s in spans if s.trace_id == trace_id]
+    return spans
+
+
+def export(directory: str, trace_id: Optional[str] = None):
+    """
+    Write the aggregated stats to stats.json and append the spans (of a run, or
+    every recent one) to spans.jsonl, one OTLP/JSON export request per line as
+    the OpenTelemetry file exporter does.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "stats.json"), "w", encoding="utf-8") as f:
+        json.dump(get_instrumentation_stats(), f, indent=2)
+
+    spans = get_recent_spans(trace_id)
+    if not spans:
+        return
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": _otlp_value("sa-assistant")}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "sa_assistant.instrumentation"},
+                        "spans": [s.to_otlp() for s in spans],
+                    }
+                ],
+            }
+        ]
+    }
+    with open(os.path.join(directory, "spans.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(request) + "\n")
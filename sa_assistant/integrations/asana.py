@@ -1,7 +1,28 @@
-from typing import List
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Set, Tuple
 import asana
+import urllib3
 from asana.rest import ApiException
 from pydantic import BaseModel
+from sqlmodel import SQLModel, Field, delete, select
+
+from ..cache import cached
+from .. import resilience
+from ..db import get_session
+from ..resilience import resilient
+from ..singleflight import singleflight
+
+
+TASK_OPT_FIELDS = (
+    "name,assignee.name,assignee.email,notes,memberships.section.name,due_at,completed"
+)
+# Maximum number of actions in a single Batch API request
+BATCH_LIMIT = 10
 
 
 class AsanaUser(BaseModel):
@@ -58,42 +79,447 @@ class AsanaTask(BaseModel):
     due_at: str | None = None
 
 
+class AsanaBatchResult(BaseModel):
+    """
+    Outcome of one action of a Batch API request.
+    """
+
+    index: int
+    status_code: int | None = None
+    task: AsanaTask | None = None
+    error: str | None = None
+
+
+class AsanaTaskRecord(SQLModel, table=True):
+    """
+    Local copy of an Asana task of a project, kept up to date by the
+    AsanaTaskMirror.
+    """
+
+    project_gid: str = Field(primary_key=True)
+    gid: str = Field(primary_key=True)
+    name: str
+    notes: str
+    assignee_gid: str | None = Field(default=None, index=True)
+    assignee_name: str | None = None
+    assignee_email: str | None = None
+    section_gid: str | None = None
+    section_name: str | None = None
+    completed: bool
+    due_at: str | None = None
+
+    @classmethod
+    def from_task(cls, project_gid: str, task: AsanaTask) -> "AsanaTaskRecord":
+        return cls(
+            project_gid=project_gid,
+            gid=task.gid,
+            name=task.name,
+            notes=task.notes,
+            assignee_gid=task.assignee.gid if task.assignee else None,
+            assignee_name=task.assignee.name if task.assignee else None,
+            assignee_email=task.assignee.email if task.assignee else None,
+            section_gid=task.section.gid if task.section else None,
+            section_name=task.section.name if task.section else None,
+            completed=task.completed,
+            due_at=task.due_at,
+        )
+
+    def to_task(self) -> AsanaTask:
+        return AsanaTask(
+            gid=self.gid,
+            name=self.name,
+            notes=self.notes,
+            assignee=AsanaUser(
+                gid=self.assignee_gid,
+                name=self.assignee_name,
+                email=self.assignee_email,
+            )
+            if self.assignee_gid
+            else None,
+            section=AsanaSection(gid=self.section_gid, name=self.section_name)
+            if self.section_gid
+            else None,
+            completed=self.completed,
+            due_at=self.due_at,
+        )
+
+
+class AsanaSyncState(SQLModel, table=True):
+    """
+    Events API sync token of a project, and when it was last used.
+    """
+
+    project_gid: str = Field(primary_key=True)
+    sync_token: str
+    last_sync: datetime
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite drops the offset, stored times are UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class AsanaProjectDirectory:
+    """
+    Process-wide cache of the projects of a team, with an index from follower
+    email to projects.
+
+    The listing is loaded on first use. Once it is older than the TTL, lookups
+    keep answering from the current listing while it is refreshed in the
+    background.
+    """
+
+    def __init__(self, loader: Callable[[], List[AsanaProject]], ttl: float = 900):
+        self._loader = loader
+        self.ttl = ttl
+        self._projects: List[AsanaProject] | None = None
+        self._by_follower: Dict[str, Set[str]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _load(self):
+        projects = self._loader()
+        by_follower: Dict[str, Set[str]] = {}
+        for project in projects:
+            for follower in project.followers:
+                by_follower.setdefault(follower.email, set()).add(project.gid)
+
+        # Swap both at once so readers never see a half-built index
+        self._projects, self._by_follower = projects, by_follower
+        self._loaded_at = time.monotonic()
+
+    def _background_refresh(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"Error refreshing Asana projects: {e}")
+        finally:
+            self._refreshing = False
+
+    def refresh(self, wait: bool = False):
+        if wait:
+            with self._lock:
+                self._load()
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _ensure_loaded(self):
+        if self._projects is None:
+            with self._lock:
+                if self._projects is None:
+                    self._load()
+        elif time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+    @property
+    def projects(self) -> List[AsanaProject]:
+        self._ensure_loaded()
+        return self._projects
+
+    def get_projects_with_users(self, user_emails: List[str]) -> List[AsanaProject]:
+        self._ensure_loaded()
+        projects, by_follower = self._projects, self._by_follower
+        if not user_emails:
+            return list(projects)
+
+        gids = set.intersection(
+            *(by_follower.get(email, set()) for email in user_emails)
+        )
+        return [p for p in projects if p.gid in gids]
+
+
+class AsanaTaskMirror:
+    """
+    Local store of the unfinished tasks of Asana projects.
+
+    A project is seeded with a full listing, then kept current through the
+    Events API: each sync reads the events since the stored sync token and
+    re-fetches the tasks modified since the last sync. When the sync token has
+    expired (HTTP 412) the project is fully re-synchronized.
+    """
+
+    def __init__(self, api: "AsanaAPI"):
+        self.api = api
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _project_lock(self, project_gid: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(project_gid, threading.Lock())
+
+    def _get_state(self, project_gid: str) -> AsanaSyncState | None:
+        with get_session() as session:
+            return session.get(AsanaSyncState, project_gid)
+
+    def _fetch_events(self, project_gid: str, sync_token: str | None):
+        """
+        Returns the events since the sync token and the new token. Raises
+        ApiException with status 412 if the token is missing or expired.
+        """
+        api = asana.EventsApi(self.api.client)
+        events = []
+        while True:
+            opts = {"sync": sync_token} if sync_token else {}
+            page = resilience.call(
+                "asana", api.get_events, project_gid, opts, full_payload=True
+            )
+            events.extend(page.get("data") or [])
+            sync_token = page["sync"]
+            if not page.get("has_more"):
+                return events, sync_token
+
+    def _new_sync_token(self, project_gid: str) -> str:
+        try:
+            _, sync_token = self._fetch_events(project_gid, None)
+            return sync_token
+        except ApiException as e:
+            if e.status != 412:
+                raise
+            return json.loads(e.body)["sync"]
+
+    def resync(self, project_gid: str):
+        # Take the token first so changes made during the listing are not lost
+        sync_token = self._new_sync_token(project_gid)
+        started_at = datetime.now(timezone.utc)
+        tasks = self.api.get_tasks_by_project(project_gid)
+        with get_session() as session:
+            session.exec(
+                delete(AsanaTaskRecord).where(
+                    AsanaTaskRecord.project_gid == project_gid
+                )
+            )
+            for task in tasks:
+                session.add(AsanaTaskRecord.from_task(project_gid, task))
+            session.merge(
+                AsanaSyncState(
+                    project_gid=project_gid,
+                    sync_token=sync_token,
+                    last_sync=started_at,
+                )
+            )
+            session.commit()
+
+    def sync(self, project_gid: str):
+        with self._project_lock(project_gid):
+            state = self._get_state(project_gid)
+            if state is None:
+                self.resync(project_gid)
+                return
+
+            started_at = datetime.now(timezone.utc)
+            try:
+                events, sync_token = self._fetch_events(project_gid, state.sync_token)
+            except ApiException as e:
+                if e.status != 412:
+                    raise
+                self.resync(project_gid)
+                return
+
+            changed = set()
+            removed = set()
+            for event in events:
+                resource = event.get("resource") or {}
+                if resource.get("resource_type") != "task":
+                    continue
+                parent = event.get("parent") or {}
+                if event.get("action") == "deleted" or (
+                    event.get("action") == "removed"
+                    and parent.get("gid") == project_gid
+                ):
+                    removed.add(resource["gid"])
+                else:
+                    changed.add(resource["gid"])
+
+            updated = []
+            if changed:
+                updated = self.api.get_tasks_by_project(
+                    project_gid,
+                    modified_since=_as_utc(state.last_sync) - timedelta(minutes=1),
+                )
+                # Completed tasks are not listed anymore, the others may have
+                # changed since the listing: ask for each of them, and only drop
+                # the ones Asana no longer knows
+                for gid in changed - {task.gid for task in updated}:
+                    task = self.api.get_task(gid)
+                    if task is None:
+                        removed.add(gid)
+                    else:
+                        updated.append(task)
+
+            with get_session() as session:
+                if removed:
+                    session.exec(
+                        delete(AsanaTaskRecord).where(
+                            AsanaTaskRecord.project_gid == project_gid,
+                            AsanaTaskRecord.gid.in_(removed),
+                        )
+                    )
+                for task in updated:
+                    session.merge(AsanaTaskRecord.from_task(project_gid, task))
+                session.merge(
+                    AsanaSyncState(
+                        project_gid=project_gid,
+                        sync_token=sync_token,
+                        last_sync=started_at,
+                    )
+                )
+                session.commit()
+
+    def ensure_fresh(self, project_gids: List[str], max_age: float):
+        stale = []
+        for project_gid in project_gids:
+            state = self._get_state(project_gid)
+            if state is None or datetime.now(timezone.utc) - _as_utc(
+                state.last_sync
+            ) > timedelta(seconds=max_age):
+                stale.append(project_gid)
+        if stale:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(self.sync, stale))
+
+    def get_tasks(self, project_gid: str, max_age: float) -> List[AsanaTask]:
+        self.ensure_fresh([project_gid], max_age)
+        with get_session() as session:
+            records = session.exec(
+                select(AsanaTaskRecord).where(
+                    AsanaTaskRecord.project_gid == project_gid,
+                    AsanaTaskRecord.completed == False,  # noqa: E712
+                )
+            )
+            return [record.to_task() for record in records]
+
+    def get_tasks_for_assignee(
+        self, project_gids: List[str], assignee_gid: str, max_age: float
+    ) -> List[AsanaTask]:
+        self.ensure_fresh(project_gids, max_age)
+        with get_session() as session:
+            records = session.exec(
+                select(AsanaTaskRecord).where(
+                    AsanaTaskRecord.project_gid.in_(project_gids),
+                    AsanaTaskRecord.assignee_gid == assignee_gid,
+                    AsanaTaskRecord.completed == False,  # noqa: E712
+                )
+            )
+            # A task can be in several projects
+            tasks = {record.gid: record.to_task() for record in records}
+            return list(tasks.values())
+
+
+_directories: Dict[Tuple[str, str], AsanaProjectDirectory] = {}
+_directories_lock = threading.Lock()
+_task_mirrors: Dict[Tuple[str, str], AsanaTaskMirror] = {}
+
+
 class AsanaAPI:
-    def __init__(self, api_token: str, team_id: str):
+    def __init__(self, api_token: str, team_id: str, projects_ttl: float = 900):
         configuration = asana.Configuration()
         configuration.access_token = api_token
         self.team_id = team_id
+        # Identifies the account in the response cache keys
+        self.cache_scope = api_token
 
         self.client = asana.ApiClient(configuration)
-        self.projects = self.get_projects_by_team(self.team_id)
+        self.client.rest_client.pool_manager.connection_pool_kw["timeout"] = (
+            urllib3.Timeout(total=resilience.get_timeout("asana"))
+        )
+
+        # The project listing is shared by every AsanaAPI of the same team
+        with _directories_lock:
+            key = (api_token, team_id)
+            if key not in _directories:
+                _directories[key] = AsanaProjectDirectory(
+                    lambda: self.get_projects_by_team(team_id), ttl=projects_ttl
+                )
+            self.directory = _directories[key]
+            if key not in _task_mirrors:
+                _task_mirrors[key] = AsanaTaskMirror(self)
+            self.task_mirror = _task_mirrors[key]
 
-    def get_user(self, user_gid="me") -> AsanaUser:
+    @property
+    def projects(self) -> List[AsanaProject]:
+        return self.directory.projects
+
+    @cached("asana.users", ttl=3600)
+    @resilient("asana")
+    def get_user(self, user_gid="me") -> AsanaUser | None:
+        """
+        Returns the user, or None if it does not exist. Other errors are raised,
+        so transient ones are retried.
+        """
         api = asana.UsersApi(self.client)
         try:
             me = api.get_user(user_gid, {})
-            return AsanaUser(
-                gid=me["gid"],
-                name=me["name"],
-                email=me["email"],
-                workspace_gid=me["workspaces"][0]["gid"],
-                workspace_name=me["workspaces"][0]["name"],
-            )
         except ApiException as e:
+            if e.status != 404:
+                raise
             print("Exception when calling UsersApi->get_user: %s\n" % e)
+            return None
+        return AsanaUser(
+            gid=me["gid"],
+            name=me["name"],
+            email=me["email"],
+            workspace_gid=me["workspaces"][0]["gid"],
+            workspace_name=me["workspaces"][0]["name"],
+        )
+
+    @resilient("asana")
+    def get_task(self, task_gid: str) -> AsanaTask | None:
+        """
+        Returns the task, completed or not, or None if it does not exist anymore.
+        """
+        api = asana.TasksApi(self.client)
+        try:
+            task = api.get_task(task_gid, {"opt_fields": TASK_OPT_FIELDS})
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            return None
+        return self._to_task(task)
+
+    def get_tasks_list(
+        self, workspace_gid: str, user_gid="me", max_age: float | None = None
+    ):
+        """
+        Returns the unfinished tasks of the user. If max_age is given, they are
+        read from the local task mirror of the team's projects instead, synced if
+        older than max_age seconds.
+        """
+        if max_age is not None:
+            if user_gid == "me":
+                user = self.get_user("me")
+                if user is None:
+                    raise ValueError("Could not resolve the current Asana user")
+                user_gid = user.gid
+            tasks = self.task_mirror.get_tasks_for_assignee(
+                [p.gid for p in self.projects], user_gid, max_age
+            )
+            return [task.model_dump() for task in tasks]
 
-    def get_tasks_list(self, workspace_gid: str, user_gid="me"):
         api = asana.UserTaskListsApi(self.client)
 
-        task_list = api.get_user_task_list_for_user(user_gid, workspace_gid, {})
+        task_list = resilience.call(
+            "asana", api.get_user_task_list_for_user, user_gid, workspace_gid, {}
+        )
 
         task_api = asana.TasksApi(self.client)
-        tasks = task_api.get_tasks_for_user_task_list(
+        tasks = resilience.call(
+            "asana",
+            task_api.get_tasks_for_user_task_list,
             task_list["gid"],
             {"opt_fields": "name,owner,notes", "completed_since": "now"},
         )
 
         return list(tasks)
 
+    @singleflight
+    @resilient("asana")
     def get_projects_by_team(self, team_gid: str) -> List[AsanaProject]:
         api = asana.ProjectsApi(self.client)
         projects = api.get_projects_for_team(
@@ -111,46 +537,248 @@ class AsanaAPI:
             for p in projects
         ]
 
-    def get_tasks_by_project(self, project_gid: str) -> List[AsanaTask]:
-        api = asana.TasksApi(self.client)
-        tasks = api.get_tasks_for_project(
-            project_gid,
-            {
-                "opt_fields": "name,assignee.name,assignee.email,notes,memberships.section.name,due_at,completed",
-                "completed_since": "now",
-            },
+    @staticmethod
+    def _to_task(t: dict) -> AsanaTask:
+        return AsanaTask(
+            gid=t["gid"],
+            name=t["name"],
+            notes=t["notes"],
+            assignee=AsanaUser(
+                gid=t["assignee"]["gid"],
+                name=t["assignee"]["name"],
+                email=t["assignee"]["email"],
+            )
+            if t.get("assignee")
+            else None,
+            section=AsanaSection(
+                gid=t["memberships"][0]["section"]["gid"],
+                name=t["memberships"][0]["section"]["name"],
+            )
+            if t.get("memberships")
+            else None,
+            completed=t["completed"],
+            due_at=t["due_at"],
         )
-        # print(list(tasks)[0])
+
+    def iter_task_pages(
+        self,
+        project_gid: str,
+        page_size: int = 100,
+        modified_since: datetime | None = None,
+    ) -> Iterator[List[AsanaTask]]:
+        """
+        Yield the unfinished tasks of a project one page at a time. If
+        modified_since is given, only tasks modified after it are returned.
+        """
+        api = asana.TasksApi(self.client)
+        opts = {
+            "project": project_gid,
+            "limit": page_size,
+            "opt_fields": TASK_OPT_FIELDS,
+            "completed_since": "now",
+        }
+        if modified_since:
+            opts["modified_since"] = modified_since.isoformat()
+
+        while True:
+            page = resilience.call(
+                "asana", api.get_tasks, dict(opts), full_payload=True
+            )
+            yield [self._to_task(t) for t in page["data"]]
+
+            next_page = page.get("next_page")
+            if not next_page:
+                break
+            opts["offset"] = next_page["offset"]
+
+    @singleflight
+    def get_tasks_by_project(
+        self,
+        project_gid: str,
+        page_size: int = 100,
+        modified_since: datetime | None = None,
+        max_age: float | None = None,
+    ) -> List[AsanaTask]:
+        """
+        Returns the unfinished tasks of the project. If max_age is given, they
+        are read from the local task mirror, synced if older than max_age seconds.
+        """
+        if max_age is not None and modified_since is None:
+            return self.task_mirror.get_tasks(project_gid, max_age)
+
         return [
-            AsanaTask(
-                gid=t["gid"],
-                name=t["name"],
-                notes=t["notes"],
-                assignee=AsanaUser(
-                    gid=t["assignee"]["gid"],
-                    name=t["assignee"]["name"],
-                    email=t["assignee"]["email"],
-                )
-                if t.get("assignee")
-                else None,
-                section=AsanaSection(
-                    gid=t["memberships"][0]["section"]["gid"],
-                    name=t["memberships"][0]["section"]["name"],
+            task
+            for page in self.iter_task_pages(project_gid, page_size, modified_since)
+            for task in page
+        ]
+
+    def iter_tasks_by_projects(
+        self,
+        project_gids: List[str],
+        page_size: int = 100,
+        max_workers: int = 4,
+        modified_since: datetime | None = None,
+        max_age: float | None = None,
+    ) -> Iterator[AsanaTask]:
+        """
+        Fetch the tasks of several projects concurrently, yielding them as soon
+        as each page arrives. Task order across projects is not preserved.
+        If max_age is given, projects are read from the local task mirror.
+        """
+        if not project_gids:
+            return
+
+        pages: queue.Queue = queue.Queue()
+        stop = threading.Event()
+
+        def fetch(project_gid: str):
+            try:
+                if max_age is not None and modified_since is None:
+                    pages.put(self.task_mirror.get_tasks(project_gid, max_age))
+                    return
+                for page in self.iter_task_pages(
+                    project_gid, page_size, modified_since
+                ):
+                    if stop.is_set():
+                        break
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(None)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for project_gid in project_gids:
+                executor.submit(fetch, project_gid)
+
+            pending = len(project_gids)
+            while pending:
+                page = pages.get()
+                if page is None:
+                    pending -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Stop the remaining workers if the caller stops early
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_batch(
+        self, actions: List[dict], max_workers: int = 4, max_retries: int = 3
+    ) -> List["AsanaBatchResult"]:
+        """
+        Run the actions through the Batch API, BATCH_LIMIT actions per request
+        and up to max_workers requests at a time. Results are returned in the
+        same order as the actions. Actions that failed with a rate limit, and
+        updates that failed with a server error, are retried on their own. A
+        creation is not retried after a server error, it may have gone through.
+        """
+        api = asana.BatchAPIApi(self.client)
+        results = [AsanaBatchResult(index=i) for i in range(len(actions))]
+        pending = list(range(len(actions)))
+
+        def run(chunk: List[int]):
+            body = {"data": {"actions": [actions[i] for i in chunk]}}
+            try:
+                response = resilience.call(
+                    "asana",
+                    api.create_batch_request,
+                    body,
+                    {},
+                    full_payload=True,
+                    idempotent=False,
                 )
-                if t.get("memberships")
-                else None,
-                completed=t["completed"],
-                due_at=t["due_at"],
-            )
-            for t in tasks
+            except Exception as e:
+                # Only this chunk failed, the results of the others still count
+                print(f"Error running an Asana batch request: {e}")
+                return chunk, None, str(e)
+            return chunk, response["data"], None
+
+        for attempt in range(max_retries + 1):
+            chunks = [
+                pending[i : i + BATCH_LIMIT]
+                for i in range(0, len(pending), BATCH_LIMIT)
+            ]
+            retry, retry_after = [], 0.0
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for chunk, responses, error in executor.map(run, chunks):
+                    if responses is None:
+                        for index in chunk:
+                            results[index].status_code = 0
+                            results[index].error = error
+                        continue
+                    for index, response in zip(chunk, responses):
+                        status = response.get("status_code", 0)
+                        body = response.get("body") or {}
+                        result = results[index]
+                        result.status_code = status
+                        if 200 <= status < 300:
+                            result.task = self._to_task(body["data"])
+                            result.error = None
+                            continue
+                        errors = body.get("errors") or [{}]
+                        result.error = errors[0].get("message", f"HTTP {status}")
+                        idempotent = actions[index]["method"].lower() != "post"
+                        if status == 429 or (status >= 500 and idempotent):
+                            retry.append(index)
+                            headers = {
+                                name.lower(): value
+                                for name, value in (
+                                    response.get("headers") or {}
+                                ).items()
+                            }
+                            retry_after = max(
+                                retry_after, float(headers.get("retry-after", 0))
+                            )
+
+            if not retry or attempt == max_retries:
+                break
+            pending = retry
+            time.sleep(retry_after or 2**attempt)
+
+        return results
+
+    def create_tasks(
+        self, tasks: List[dict], max_workers: int = 4
+    ) -> List["AsanaBatchResult"]:
+        """
+        Create the tasks in bulk through the Batch API. Each task is a dict of
+        Asana task fields (name, notes, projects, assignee, due_on, ...).
+        """
+        actions = [
+            {
+                "method": "post",
+                "relative_path": "/tasks",
+                "data": task,
+                "options": {"fields": TASK_OPT_FIELDS.split(",")},
+            }
+            for task in tasks
         ]
+        return self._run_batch(actions, max_workers=max_workers)
+
+    def update_tasks(
+        self, updates: Dict[str, dict], max_workers: int = 4
+    ) -> List["AsanaBatchResult"]:
+        """
+        Update tasks in bulk through the Batch API. Maps a task gid to the task
+        fields to change. Results follow the order of the mapping.
+        """
+        actions = [
+            {
+                "method": "put",
+                "relative_path": f"/tasks/{task_gid}",
+                "data": fields,
+                "options": {"fields": TASK_OPT_FIELDS.split(",")},
+            }
+            for task_gid, fields in updates.items()
+        ]
+        return self._run_batch(actions, max_workers=max_workers)
 
     def get_projects_with_users(self, user_emails: List[str]) -> List[AsanaProject]:
         """
         Returns the list of projects that have all the given users as followers.
         """
-        results = []
-        for project in self.projects:
-            if set(user_emails).issubset(set(f.email for f in project.followers)):
-                results.append(project)
-        return results
+        return self.directory.get_projects_with_users(user_emails)
@@ -2,9 +2,13 @@ import os
 import json
 from pathlib import Path
 
+import httplib2
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 
+from ... import resilience
+
 
 SCOPES = [
     "https://www.googleapis.com/auth/calendar",
@@ -17,6 +21,8 @@ class GoogleAPI:
     def __init__(self):
         self.client_secrets_file = Path("google_secrets.json")
         self.credentials_file = Path("google_credentials.json")
+        # Identifies the account in the response cache keys
+        self.cache_scope = str(self.credentials_file.resolve())
 
     def authenticate_once(self):
         flow = InstalledAppFlow.from_client_secrets_file(
@@ -57,5 +63,14 @@ class GoogleAPI:
             self.save_credentials(credentials)
         return credentials
 
+    def get_http(self) -> AuthorizedHttp:
+        """
+        Authorized transport with the request timeout of the "google" policy.
+        """
+        return AuthorizedHttp(
+            self.get_credentials(),
+            http=httplib2.Http(timeout=resilience.get_timeout("google")),
+        )
+
     def get_service(self):
         raise NotImplementedError
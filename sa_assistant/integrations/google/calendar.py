@@ -2,8 +2,13 @@ from typing import List, Optional
 from googleapiclient.discovery import build
 from pydantic import BaseModel
 
+from ...cache import cached, invalidates
+from ...resilience import resilient
+from ...singleflight import singleflight
 from .base import GoogleAPI
 
+EVENTS_CACHE = "google.calendar.events"
+
 
 class CalendarEvent(BaseModel):
     id: str
@@ -18,8 +23,10 @@ class CalendarEvent(BaseModel):
 
 class GoogleCalendarAPI(GoogleAPI):
     def get_service(self):
-        return build("calendar", "v3", credentials=self.get_credentials())
+        return build("calendar", "v3", http=self.get_http())
 
+    @invalidates(EVENTS_CACHE)
+    @resilient("google")
     def delete_event(self, event_id: str, calendar_id="primary") -> CalendarEvent:
         service = self.get_service()
         event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
@@ -36,6 +43,9 @@ class GoogleCalendarAPI(GoogleAPI):
             start=event_start,
         )
 
+    @cached(EVENTS_CACHE, ttl=120, stale_ttl=600)
+    @singleflight
+    @resilient("google")
     def get_events(
         self,
         calendar_id: str,
@@ -81,6 +91,8 @@ class GoogleCalendarAPI(GoogleAPI):
 
         return formatted_events
 
+    @invalidates(EVENTS_CACHE)
+    @resilient("google", idempotent=False)
     def create_event(self, calendar_id, event_body) -> CalendarEvent:
         created_event = (
             self.get_service()
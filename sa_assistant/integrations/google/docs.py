@@ -1,12 +1,18 @@
 from googleapiclient.discovery import build
 
+from ...cache import cached
+from ...resilience import resilient
+from ...singleflight import singleflight
 from .base import GoogleAPI
 
 
 class GoogleDocsAPI(GoogleAPI):
     def get_service(self):
-        return build("docs", "v1", credentials=self.get_credentials())
+        return build("docs", "v1", http=self.get_http())
 
+    @cached("google.docs.documents", ttl=600, stale_ttl=3600)
+    @singleflight
+    @resilient("google")
     def get_document(self, document_id: str) -> dict:
         service = self.get_service()
         return service.documents().get(documentId=document_id).execute()
@@ -4,15 +4,22 @@ from googleapiclient.discovery import build, Resource
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload
 
+from ...cache import cached, invalidates
+from ...progress import report_progress
+from ...resilience import resilient
+from ...singleflight import singleflight
 from .base import GoogleAPI
 
+FILES_CACHE = "google.drive.files"
+
 
 class GoogleDriveAPI(GoogleAPI):
     """Google Drive API wrapper for file and folder operations."""
 
     def get_service(self) -> Resource:
-        return build("drive", "v3", credentials=self.get_credentials())
+        return build("drive", "v3", http=self.get_http())
 
+    @resilient("google")
     def read_file(
         self, file_id: str, download_path: Optional[str] = None
     ) -> Union[bytes, str]:
@@ -101,6 +108,8 @@ class GoogleDriveAPI(GoogleAPI):
                 status, done = downloader.next_chunk()
             return file_content.getvalue()
 
+    @invalidates(FILES_CACHE)
+    @resilient("google", idempotent=False)
     def create_file(
         self,
         name: str,
@@ -175,6 +184,8 @@ class GoogleDriveAPI(GoogleAPI):
             print(f"An error occurred: {error}")
             raise
 
+    @invalidates(FILES_CACHE)
+    @resilient("google", idempotent=False)
     def update_file(
         self,
         file_id: str,
@@ -254,6 +265,8 @@ class GoogleDriveAPI(GoogleAPI):
             print(f"An error occurred: {error}")
             raise
 
+    @invalidates(FILES_CACHE)
+    @resilient("google", idempotent=False)
     def delete_file(self, file_id: str) -> bool:
         """
         Delete a file from Google Drive.
@@ -273,6 +286,8 @@ class GoogleDriveAPI(GoogleAPI):
             print(f"An error occurred: {error}")
             raise
 
+    @invalidates(FILES_CACHE)
+    @resilient("google", idempotent=False)
     def create_folder(
         self,
         name: str,
@@ -322,6 +337,9 @@ class GoogleDriveAPI(GoogleAPI):
 
     # Additional utility methods
 
+    @cached(FILES_CACHE, ttl=300, stale_ttl=900)
+    @singleflight
+    @resilient("google")
     def list_files(
         self,
         query: Optional[str] = None,
@@ -579,6 +597,11 @@ class GoogleDriveAPI(GoogleAPI):
                 if item["mimeType"] == "application/vnd.google-apps.folder":
                     folders_to_process.append(item["id"])
 
+            report_progress(
+                f"Listed {len(all_files)} files, "
+                f"{len(folders_to_process)} folders left to list"
+            )
+
         return all_files
 
     def download_file_by_path(
@@ -0,0 +1,120 @@
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from jira import JIRA, Issue
+from requests.adapters import HTTPAdapter
+from sqlmodel import SQLModel, Field
+
+from .. import resilience
+from ..context import JiraContext
+
+
+class JiraIssue(SQLModel, table=True):
+    """
+    Local copy of a Jira issue, kept up to date by the JiraMirror.
+    """
+
+    key: str = Field(primary_key=True)
+    project: str = Field(index=True)
+    summary: str
+    description: str | None = None
+    status: str
+    issue_type: str | None = None
+    priority: str | None = None
+    assignee: str | None = None
+    assignee_email: str | None = None
+    story_points: float | None = None
+    sprint: str | None = None
+    in_open_sprint: bool = False
+    updated: datetime
+    # JSON encoded lists, merged on every sync
+    comments: str = "[]"
+    transitions: str = "[]"
+
+
+class JiraSyncState(SQLModel, table=True):
+    """
+    Last time the issues of a project were synchronized.
+    """
+
+    project: str = Field(primary_key=True)
+    last_sync: datetime
+
+
+class JiraAPI:
+    """
+    Wrapper around the JIRA client. The underlying requests session is kept alive
+    between calls, so reusing an instance avoids a new TLS connection and
+    server-info handshake per tool call.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_email: str,
+        api_key: str,
+        pool_maxsize: int = 10,
+        timeout: float | None = None,
+    ):
+        self.base_url = base_url
+        self.api_email = api_email
+        # Retries are left to the resilience layer
+        self.client = JIRA(
+            server=base_url,
+            basic_auth=(api_email, api_key),
+            timeout=timeout,
+            max_retries=0,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.client._session.mount("https://", adapter)
+        self.client._session.mount("http://", adapter)
+
+    def search_issues(
+        self,
+        jql: str,
+        fields: Optional[List[str]] = None,
+        limit: int = 500,
+        page_size: int = 100,
+        expand: Optional[str] = None,
+    ) -> Iterator[Issue]:
+        """
+        Stream the issues matching the JQL query, one page at a time, up to limit.
+        Only the given fields are requested (all of them if fields is None).
+        """
+        start_at = 0
+        while start_at < limit:
+            page = resilience.call(
+                "jira",
+                self.client.search_issues,
+                jql,
+                startAt=start_at,
+                maxResults=min(page_size, limit - start_at),
+                fields=",".join(fields) if fields else "*all",
+                expand=expand,
+            )
+            yield from page
+
+            start_at += len(page)
+            if not page or page.isLast or start_at >= page.total:
+                break
+
+
+_clients: Dict[Tuple[str, str, str], JiraAPI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_jira_api(jira_context: JiraContext) -> JiraAPI:
+    """
+    Get the shared JiraAPI for the given context, creating it on first use.
+    """
+    key = (jira_context.base_url, jira_context.api_email, jira_context.api_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = JiraAPI(
+                jira_context.base_url,
+                jira_context.api_email,
+                jira_context.api_key,
+                timeout=resilience.get_timeout("jira"),
+            )
+        return _clients[key]
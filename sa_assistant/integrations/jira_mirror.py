@@ -0,0 +1,360 @@
+import json
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from ..context import JiraContext
+from ..db import get_session
+from ..utils import email_to_name
+from .jira import JiraAPI, JiraIssue, JiraSyncState, get_jira_api
+
+
+_ORDER_BY_RE = re.compile(r"\s+ORDER\s+BY\s+(.+)$", re.IGNORECASE)
+_AND_RE = re.compile(r"\s+AND\s+", re.IGNORECASE)
+_CLAUSE_RE = re.compile(
+    r'^("[^"]+"|\w+)\s*(!=|=|>=|>|not\s+in|in|is\s+not|is)\s*(.+)$', re.IGNORECASE
+)
+_RELATIVE_DATE_RE = re.compile(r"^-(\d+)([wdhm])$", re.IGNORECASE)
+_UNITS = {"w": "weeks", "d": "days", "h": "hours", "m": "minutes"}
+_LIST_RE = re.compile(r"^\((.*)\)$")
+_LEGACY_SPRINT_RE = re.compile(r"(\w+)=([^,\]]*)")
+
+# Fields of the JiraIssue table a JQL field maps to
+_FIELD_COLUMNS = {
+    "project": JiraIssue.project,
+    "status": JiraIssue.status,
+    "type": JiraIssue.issue_type,
+    "issuetype": JiraIssue.issue_type,
+    "priority": JiraIssue.priority,
+}
+
+
+class UnsupportedQuery(Exception):
+    """
+    The JQL query uses something the local mirror cannot answer.
+    """
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def _split_and(jql: str) -> List[str]:
+    # Splitting on AND is only safe if it never appears inside a quoted value
+    if re.search(r"\bOR\b|\bNOT\s+\(|\bWAS\b|\bCHANGED\b|~", jql, re.IGNORECASE):
+        raise UnsupportedQuery(jql)
+    return [c.strip() for c in _AND_RE.split(jql) if c.strip()]
+
+
+def parse_sprint(sprint) -> Dict:
+    # Jira Server returns sprints as "com.atlassian...Sprint@1[id=1,state=ACTIVE,...]"
+    if isinstance(sprint, str):
+        values = dict(_LEGACY_SPRINT_RE.findall(sprint))
+        return {"name": values.get("name"), "state": values.get("state", "").lower()}
+    return sprint
+
+
+def _parse_values(raw: str) -> List[str]:
+    match = _LIST_RE.match(raw.strip())
+    if not match:
+        return [_unquote(raw)]
+    return [_unquote(v) for v in match.group(1).split(",") if v.strip()]
+
+
+class JiraMirror:
+    """
+    Local SQLite copy of the issues of the configured Jira boards.
+
+    The mirror is seeded once per board and then refreshed incrementally with
+    `updated >= -Nm` queries, merging comment and status-change deltas into the
+    stored issues. Queries it cannot express locally raise UnsupportedQuery so
+    the caller can fall through to a live Jira search.
+    """
+
+    def __init__(self, api: JiraAPI, jira_context: JiraContext):
+        self.api = api
+        self.jira_context = jira_context
+        self.boards = [b.upper() for b in jira_context.boards]
+        self._lock = threading.Lock()
+        self._board_locks: Dict[str, threading.RLock] = {}
+
+    @property
+    def _fields(self) -> List[str]:
+        return [
+            "summary",
+            "description",
+            "status",
+            "issuetype",
+            "priority",
+            "assignee",
+            "updated",
+            "comment",
+            self.jira_context.story_points_field,
+            self.jira_context.sprint_field,
+        ]
+
+    def _board_lock(self, board: str) -> threading.RLock:
+        with self._lock:
+            return self._board_locks.setdefault(board, threading.RLock())
+
+    def _get_last_sync(self, board: str) -> Optional[datetime]:
+        with get_session() as session:
+            state = session.get(JiraSyncState, board)
+            if not state:
+                return None
+            return state.last_sync.replace(tzinfo=timezone.utc)
+
+    def is_fresh(self, board: str) -> bool:
+        last_sync = self._get_last_sync(board)
+        if last_sync is None:
+            return False
+        age = datetime.now(timezone.utc) - last_sync
+        return age <= timedelta(seconds=self.jira_context.mirror_max_age)
+
+    def sync(self, board: str, full: bool = False):
+        """
+        Bring the mirror of the given board up to date with Jira.
+        """
+        board = board.upper()
+        with self._board_lock(board):
+            started_at = datetime.now(timezone.utc)
+            last_sync = None if full else self._get_last_sync(board)
+            if last_sync is None:
+                seed_days = self.jira_context.mirror_seed_days
+                jql = (
+                    f'project = "{board}" AND '
+                    f"(Sprint in openSprints() OR updated >= -{seed_days}d)"
+                )
+            else:
+                # Relative durations avoid depending on the Jira user's timezone
+                minutes = int((started_at - last_sync).total_seconds() // 60) + 2
+                jql = f'project = "{board}" AND updated >= -{minutes}m'
+
+            issues = self.api.search_issues(
+                jql,
+                fields=self._fields,
+                limit=100_000,
+                page_size=self.jira_context.page_size,
+                expand="changelog",
+            )
+            with get_session() as session:
+                for issue in issues:
+                    existing = session.get(JiraIssue, issue.key)
+                    session.add(self._to_record(issue.raw, existing))
+                session.commit()
+
+            # Closing a sprint does not touch the issues, so refresh membership
+            open_sprint_keys = {
+                issue.key
+                for issue in self.api.search_issues(
+                    f'project = "{board}" AND Sprint in openSprints()',
+                    fields=["key"],
+                    limit=100_000,
+                    page_size=self.jira_context.page_size,
+                )
+            }
+            with get_session() as session:
+                records = session.exec(
+                    select(JiraIssue).where(JiraIssue.project == board)
+                )
+                for record in records:
+                    in_open_sprint = record.key in open_sprint_keys
+                    if record.in_open_sprint != in_open_sprint:
+                        record.in_open_sprint = in_open_sprint
+                        session.add(record)
+                session.merge(
+                    JiraSyncState(
+                        project=board, last_sync=started_at.replace(tzinfo=None)
+                    )
+                )
+                session.commit()
+
+    def _to_record(self, raw: Dict, existing: Optional[JiraIssue]) -> JiraIssue:
+        fields = raw["fields"]
+        assignee = fields.get("assignee") or {}
+        sprints = [
+            parse_sprint(s) for s in fields.get(self.jira_context.sprint_field) or []
+        ]
+        story_points = fields.get(self.jira_context.story_points_field)
+
+        record = existing or JiraIssue(
+            key=raw["key"], project="", summary="", status="", updated=datetime.now()
+        )
+        record.project = raw["key"].split("-")[0]
+        record.summary = fields.get("summary") or ""
+        record.description = fields.get("description")
+        record.status = (fields.get("status") or {}).get("name", "")
+        record.issue_type = (fields.get("issuetype") or {}).get("name")
+        record.priority = (fields.get("priority") or {}).get("name")
+        record.assignee = assignee.get("displayName")
+        record.assignee_email = assignee.get("emailAddress")
+        record.story_points = float(story_points) if story_points is not None else None
+        record.sprint = sprints[-1].get("name") if sprints else None
+        record.in_open_sprint = any(s.get("state") == "active" for s in sprints)
+        record.updated = (
+            datetime.strptime(fields["updated"], "%Y-%m-%dT%H:%M:%S.%f%z")
+            .astimezone(timezone.utc)
+            .replace(tzinfo=None)
+        )
+
+        comments = {c["id"]: c for c in json.loads(record.comments)}
+        for comment in (fields.get("comment") or {}).get("comments", []):
+            author = comment.get("author") or {}
+            comments[comment["id"]] = {
+                "id": comment["id"],
+                "author": author.get("displayName", ""),
+                "account_type": author.get("accountType"),
+                "body": comment.get("body") or "",
+                "created": comment.get("created"),
+            }
+        record.comments = json.dumps(
+            sorted(comments.values(), key=lambda c: c["created"] or "")
+        )
+
+        transitions = {t["id"]: t for t in json.loads(record.transitions)}
+        for history in (raw.get("changelog") or {}).get("histories", []):
+            for item in history.get("items", []):
+                if item.get("field") == "status":
+                    transitions[history["id"]] = {
+                        "id": history["id"],
+                        "created": history.get("created"),
+                        "from": item.get("fromString"),
+                        "to": item.get("toString"),
+                    }
+        record.transitions = json.dumps(
+            sorted(transitions.values(), key=lambda t: t["created"] or "")
+        )
+        return record
+
+    def _build_statement(self, jql: str) -> Tuple[object, List[str]]:
+        order_by = JiraIssue.updated.desc()
+        match = _ORDER_BY_RE.search(jql)
+        if match:
+            jql = jql[: match.start()]
+            order = match.group(1).strip().split()
+            column = {"updated": JiraIssue.updated, "key": JiraIssue.key}.get(
+                order[0].lower()
+            )
+            if column is None or len(order) > 2:
+                raise UnsupportedQuery(match.group(1))
+            descending = len(order) == 1 or order[1].upper() == "DESC"
+            order_by = column.desc() if descending else column.asc()
+
+        statement = select(JiraIssue)
+        projects = []
+        # The mirror only holds the open sprints and the last mirror_seed_days
+        bounded = False
+        for clause in _split_and(jql):
+            match = _CLAUSE_RE.match(clause)
+            if not match:
+                raise UnsupportedQuery(clause)
+            field = _unquote(match.group(1)).lower()
+            operator = " ".join(match.group(2).lower().split())
+            values = _parse_values(match.group(3))
+
+            lowered = [v.lower() for v in values]
+            if field == "sprint" and operator == "in" and lowered == ["opensprints()"]:
+                statement = statement.where(JiraIssue.in_open_sprint)
+                bounded = True
+            elif field == "updated" and operator in (">=", ">"):
+                since = self._relative_date(clause, values)
+                statement = statement.where(JiraIssue.updated >= since)
+                bounded = True
+            elif field == "assignee":
+                statement = statement.where(self._assignee_condition(operator, values))
+            elif field in _FIELD_COLUMNS and operator in ("=", "!=", "in", "not in"):
+                column = _FIELD_COLUMNS[field]
+                if field == "project":
+                    if operator not in ("=", "in"):
+                        raise UnsupportedQuery(clause)
+                    projects.extend(v.upper() for v in values)
+                if operator in ("=", "in"):
+                    statement = statement.where(func.lower(column).in_(lowered))
+                else:
+                    statement = statement.where(func.lower(column).not_in(lowered))
+            else:
+                raise UnsupportedQuery(clause)
+
+        # Without a project restriction the mirror could be missing results
+        if not projects or any(p not in self.boards for p in projects):
+            raise UnsupportedQuery(jql)
+        if not bounded:
+            raise UnsupportedQuery(jql)
+
+        return statement.order_by(order_by), projects
+
+    def _relative_date(self, clause: str, values: List[str]) -> datetime:
+        match = _RELATIVE_DATE_RE.match(values[0]) if len(values) == 1 else None
+        if not match:
+            raise UnsupportedQuery(clause)
+        delta = timedelta(**{_UNITS[match.group(2).lower()]: int(match.group(1))})
+        if delta > timedelta(days=self.jira_context.mirror_seed_days):
+            raise UnsupportedQuery(clause)
+        return (datetime.now(timezone.utc) - delta).replace(tzinfo=None)
+
+    def _assignee_condition(self, operator: str, values: List[str]):
+        if operator in ("is", "is not") and [v.upper() for v in values] == ["EMPTY"]:
+            if operator == "is":
+                return JiraIssue.assignee.is_(None)
+            return JiraIssue.assignee.is_not(None)
+
+        emails = [
+            self.jira_context.api_email if v.lower() == "currentuser()" else v
+            for v in values
+        ]
+        if any("@" not in e for e in emails):
+            raise UnsupportedQuery(f"assignee {operator} {values}")
+        # Jira often hides emails, so match the display name derived from them too
+        names = [email_to_name(e).lower() for e in emails]
+        lowered = [e.lower() for e in emails]
+        condition = func.lower(JiraIssue.assignee_email).in_(lowered) | func.lower(
+            JiraIssue.assignee
+        ).in_(names)
+        if operator in ("=", "in"):
+            return condition
+        if operator in ("!=", "not in"):
+            return ~condition | JiraIssue.assignee.is_(None)
+        raise UnsupportedQuery(f"assignee {operator} {values}")
+
+    def query(self, jql: str, limit: Optional[int] = None) -> List[JiraIssue]:
+        """
+        Answer the JQL query from the local mirror, syncing the boards it touches
+        first if they are older than the freshness bound.
+
+        Only queries restricted to the open sprints or to a recent `updated`
+        window (no longer than the seed window) are answered locally. Raises
+        UnsupportedQuery if the query cannot be answered locally.
+        """
+        statement, projects = self._build_statement(jql)
+        for project in set(projects):
+            # Concurrent queries wait for the sync of the first one
+            with self._board_lock(project):
+                if not self.is_fresh(project):
+                    self.sync(project)
+
+        if limit:
+            statement = statement.limit(limit)
+        with get_session() as session:
+            return list(session.exec(statement))
+
+
+_mirrors: Dict[Tuple[str, str, Tuple[str, ...]], JiraMirror] = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_jira_mirror(jira_context: JiraContext) -> JiraMirror:
+    """
+    Get the shared JiraMirror for the given context, creating it on first use.
+    """
+    key = (jira_context.base_url, jira_context.api_email, tuple(jira_context.boards))
+    with _mirrors_lock:
+        if key not in _mirrors:
+            _mirrors[key] = JiraMirror(get_jira_api(jira_context), jira_context)
+        return _mirrors[key]
@@ -1,11 +1,22 @@
-from typing import List
-from slack_sdk import WebClient
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Tuple
+
+import aiohttp
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
 from sqlmodel import SQLModel, Field
 
+from .. import resilience
+from ..cache import cached
+from ..singleflight import singleflight
+
 
 class SlackConversation(SQLModel):
     id: str = Field(primary_key=True)
-    name: str
+    name: str = Field(index=True)
 
 
 class SlackChannel(SlackConversation, table=True):
@@ -16,54 +27,330 @@ class SlackChat(SlackConversation, table=True):
     real_name: str
 
 
+class SlackHistoryState(SQLModel, table=True):
+    """
+    Newest top-level message of a channel already ingested into the vector store.
+    """
+
+    channel_id: str = Field(primary_key=True)
+    oldest: str
+    last_sync: datetime
+
+
+class SlackThreadState(SQLModel, table=True):
+    """
+    Newest reply of a thread already ingested into the vector store, so the
+    thread is read again only when it gets newer ones.
+    """
+
+    channel_id: str = Field(primary_key=True)
+    thread_ts: str = Field(primary_key=True)
+    latest_reply: str
+
+
+# Requests per minute allowed for each Web API method, from Slack's rate limit
+# tiers. chat.postMessage is limited to about one message per second and channel.
+METHOD_RATE_LIMITS = {
+    "conversations.list": 20,
+    "users.list": 20,
+    "conversations.info": 50,
+    "users.lookupByEmail": 50,
+    "conversations.history": 50,
+    "conversations.replies": 50,
+    "chat.postMessage": 60,
+}
+DEFAULT_RATE_LIMIT = 20
+# Slack truncates longer texts, longer messages are split into a thread
+MAX_MESSAGE_LENGTH = 4000
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every caller of a Slack method. Callers reserve a token
+    under a lock and sleep outside of it until the token is available, so it works
+    from any thread and event loop.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int | None = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or max(1, int(rate_per_minute // 10))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token and return how many seconds to wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def split_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Split a message into chunks of at most max_length characters, preferring
+    paragraph, then line, then word boundaries.
+    """
+    chunks = []
+    while len(message) > max_length:
+        window = message[:max_length]
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = window.rfind(separator)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = max_length
+        chunks.append(message[:cut].rstrip())
+        message = message[cut:].lstrip()
+    if message:
+        chunks.append(message)
+    return chunks
+
+
 class SlackAPI:
-    def __init__(self, api_token):
+    """
+    Async Slack client. Every request waits for the token bucket of its method and
+    goes through the "slack" resilience policy, which retries 429s and transient
+    failures (messages are only retried on 429). Each event
+    loop gets its own AsyncWebClient, with one aiohttp session shared by all its
+    requests.
+    """
+
+    def __init__(self, api_token: str):
         self.api_token = api_token
-        self.client = WebClient(token=self.api_token)
+        # Identifies the workspace in the response cache keys
+        self.cache_scope = api_token
+        self._clients: Dict[asyncio.AbstractEventLoop, AsyncWebClient] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> AsyncWebClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._clients:
+                client = AsyncWebClient(
+                    token=self.api_token,
+                    session=aiohttp.ClientSession(),
+                    timeout=int(resilience.get_timeout("slack")),
+                )
+                self._clients[loop] = client
+            return self._clients[loop]
 
-    def fetch_channels(self) -> List[SlackChannel]:
-        results = []
+    def _bucket(self, method: str, key: str | None = None) -> TokenBucket:
+        name = f"{method}:{key}" if key else method
+        with self._lock:
+            if name not in self._buckets:
+                rate = METHOD_RATE_LIMITS.get(method, DEFAULT_RATE_LIMIT)
+                self._buckets[name] = TokenBucket(rate)
+            return self._buckets[name]
 
-        channels_response = self.client.conversations_list(
-            types="public_channel,private_channel"
+    async def _call(self, method: str, key: str | None = None, **kwargs):
+        await self._bucket(method, key).acquire()
+        # conversations.list -> AsyncWebClient.conversations_list
+        return await resilience.acall(
+            "slack",
+            getattr(self.client, method.replace(".", "_")),
+            idempotent=not method.startswith("chat."),
+            **kwargs,
         )
 
-        for channel in channels_response["channels"]:
-            results.append(
+    async def close(self):
+        """
+        Close the aiohttp session of the running event loop.
+        """
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client:
+            await client.session.close()
+
+    async def iter_channel_pages(
+        self, page_size: int = 1000
+    ) -> AsyncIterator[List[SlackChannel]]:
+        """
+        Yield the non-archived channels of the workspace, one page at a time.
+        """
+        next_cursor = None
+        while True:
+            response = await self._call(
+                "conversations.list",
+                types="public_channel,private_channel",
+                exclude_archived=True,
+                limit=page_size,
+                cursor=next_cursor,
+            )
+
+            yield [
                 SlackChannel(
                     id=channel["id"],
                     name=channel["name"],
                     is_private=channel.get("is_private", False),
                 )
-            )
+                for channel in response["channels"]
+            ]
+
+            next_cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not next_cursor:
+                break
 
-        return results
+    async def fetch_channels(self) -> List[SlackChannel]:
+        return [channel async for page in self.iter_channel_pages() for channel in page]
 
-    def fetch_chats(self) -> List[SlackChat]:
-        results = []
+    async def iter_chat_pages(
+        self, page_size: int = 200
+    ) -> AsyncIterator[List[SlackChat]]:
+        """
+        Yield the users of the workspace, one page at a time.
+        """
         next_cursor = None
         while True:
-            response = self.client.users_list(limit=200, cursor=next_cursor)
-
-            for user in response["members"]:
-                results.append(
-                    SlackChat(
-                        id=user["id"],
-                        real_name=user.get(
-                            "real_name", user.get("profile", {}).get("real_name", "")
-                        ),
-                        name=user.get("name"),
-                    )
+            response = await self._call(
+                "users.list", limit=page_size, cursor=next_cursor
+            )
+
+            yield [
+                SlackChat(
+                    id=user["id"],
+                    real_name=user.get(
+                        "real_name", user.get("profile", {}).get("real_name", "")
+                    ),
+                    name=user.get("name"),
                 )
+                for user in response["members"]
+            ]
+
+            next_cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not next_cursor:
+                break
+
+    async def fetch_chats(self) -> List[SlackChat]:
+        return [chat async for page in self.iter_chat_pages() for chat in page]
+
+    @cached("slack.users", ttl=3600)
+    @singleflight
+    async def lookup_user_by_email(self, email: str) -> SlackChat | None:
+        try:
+            response = await self._call("users.lookupByEmail", email=email)
+        except SlackApiError as e:
+            if e.response["error"] == "users_not_found":
+                return None
+            raise
+        user = response["user"]
+        return SlackChat(
+            id=user["id"],
+            real_name=user.get(
+                "real_name", user.get("profile", {}).get("real_name", "")
+            ),
+            name=user.get("name"),
+        )
+
+    @cached("slack.channels", ttl=3600)
+    @singleflight
+    async def fetch_channel_info(self, channel_id: str) -> SlackChannel | None:
+        try:
+            response = await self._call("conversations.info", channel=channel_id)
+        except SlackApiError as e:
+            if e.response["error"] == "channel_not_found":
+                return None
+            raise
+        channel = response["channel"]
+        if not channel.get("name"):
+            # Direct messages have no name
+            return None
+        return SlackChannel(
+            id=channel["id"],
+            name=channel["name"],
+            is_private=channel.get("is_private", False),
+        )
+
+    async def iter_history_pages(
+        self, channel_id: str, oldest: str | None = None, page_size: int = 200
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Yield the top-level messages of a channel newer than the oldest timestamp,
+        one page at a time, newest first.
+        """
+        next_cursor = None
+        while True:
+            response = await self._call(
+                "conversations.history",
+                key=channel_id,
+                channel=channel_id,
+                oldest=oldest,
+                limit=page_size,
+                cursor=next_cursor,
+            )
+
+            yield response["messages"]
 
-            if not response.get("response_metadata").get("next_cursor"):
+            next_cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
                 break
 
-            next_cursor = response["response_metadata"]["next_cursor"]
+    async def fetch_replies(
+        self, channel_id: str, thread_ts: str, page_size: int = 200
+    ) -> List[Dict]:
+        """
+        Fetch a thread, parent message first.
+        """
+        messages = []
+        next_cursor = None
+        while True:
+            response = await self._call(
+                "conversations.replies",
+                key=channel_id,
+                channel=channel_id,
+                ts=thread_ts,
+                limit=page_size,
+                cursor=next_cursor,
+            )
+            messages.extend(response["messages"])
 
-        return results
+            next_cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
+                return messages
 
-    def send_message(self, channel_id: str, message: str):
-        response = self.client.chat_postMessage(channel=channel_id, text=message)
+    async def send_message(self, channel_id: str, message: str) -> List[Dict]:
+        """
+        Send a message, splitting it into a thread if it is too long for Slack.
+        Returns the response of every chunk sent.
+        """
+        responses = []
+        thread_ts = None
+        for chunk in split_message(message):
+            kwargs = {"channel": channel_id, "text": chunk}
+            if thread_ts:
+                kwargs["thread_ts"] = thread_ts
+            response = await self._call("chat.postMessage", key=channel_id, **kwargs)
+            thread_ts = thread_ts or response["ts"]
+            responses.append(response.data)
+        return responses
 
-        return response
+    async def send_messages(
+        self, messages: List[Tuple[str, str]]
+    ) -> List[List[Dict] | Exception]:
+        """
+        Send (channel_id, message) pairs concurrently. The result of each message
+        is either the responses of its chunks or the exception that stopped it.
+        """
+        return await asyncio.gather(
+            *(
+                self.send_message(channel_id, message)
+                for channel_id, message in messages
+            ),
+            return_exceptions=True,
+        )
@@ -0,0 +1,243 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlmodel import delete, select
+
+from ..context import SlackContext
+from ..db import get_session
+from .slack import (
+    SlackAPI,
+    SlackChannel,
+    SlackChat,
+    SlackHistoryState,
+    SlackThreadState,
+)
+
+# Messages that say nothing about the project
+_SKIPPED_SUBTYPES = {
+    "channel_join",
+    "channel_leave",
+    "channel_topic",
+    "channel_purpose",
+    "channel_name",
+    "channel_archive",
+    "channel_unarchive",
+    "pinned_item",
+}
+# Consecutive messages outside of threads are grouped up to this many characters
+_MAX_CHUNK_CHARS = 2000
+
+
+def _days_ago_ts(days: int) -> str:
+    return f"{time.time() - days * 86400:.6f}"
+
+
+class SlackHistoryIngester:
+    """
+    Incrementally copies the history of Slack channels into the vector store.
+
+    Every thread becomes one document (parent and replies), and consecutive
+    messages outside of threads are grouped into documents of a bounded size.
+    The newest ingested top-level message of each channel is stored as a
+    watermark after every batch, so an interrupted run resumes where it stopped
+    and re-runs only read new messages. Threads started in the last
+    history_thread_window_days are re-read when they get replies newer than the
+    ones ingested, which are tracked per thread.
+    """
+
+    def __init__(self, api: SlackAPI, store, slack_context: SlackContext):
+        self.api = api
+        self.store = store
+        self.slack_context = slack_context
+        self._names: Dict[str, str] = {}
+
+    def _load_names(self):
+        with get_session() as session:
+            self._names = {
+                chat.id: chat.real_name or chat.name
+                for chat in session.exec(select(SlackChat))
+            }
+
+    def _get_watermark(self, channel_id: str) -> Optional[str]:
+        with get_session() as session:
+            state = session.get(SlackHistoryState, channel_id)
+            return state.oldest if state else None
+
+    def _set_watermark(self, channel_id: str, oldest: str):
+        with get_session() as session:
+            session.merge(
+                SlackHistoryState(
+                    channel_id=channel_id, oldest=oldest, last_sync=datetime.now()
+                )
+            )
+            session.commit()
+
+    def _get_thread_states(self, channel_id: str) -> Dict[str, str]:
+        with get_session() as session:
+            return {
+                state.thread_ts: state.latest_reply
+                for state in session.exec(
+                    select(SlackThreadState).where(
+                        SlackThreadState.channel_id == channel_id
+                    )
+                )
+            }
+
+    def _set_thread_states(self, channel_id: str, latest_replies: Dict[str, str]):
+        # Threads older than the window are never re-read, their state can go
+        thread_window = _days_ago_ts(self.slack_context.history_thread_window_days)
+        with get_session() as session:
+            for thread_ts, latest_reply in latest_replies.items():
+                session.merge(
+                    SlackThreadState(
+                        channel_id=channel_id,
+                        thread_ts=thread_ts,
+                        latest_reply=latest_reply,
+                    )
+                )
+            session.exec(
+                delete(SlackThreadState).where(
+                    SlackThreadState.channel_id == channel_id,
+                    SlackThreadState.thread_ts < thread_window,
+                )
+            )
+            session.commit()
+
+    def _format(self, message: Dict) -> str:
+        user = message.get("user")
+        author = self._names.get(user, user) or message.get("username") or "bot"
+        return f"{author}: {message.get('text', '').strip()}"
+
+    def _document(
+        self, channel_id: str, channel_name: str, messages: List[Dict], kind: str
+    ) -> Dict:
+        ts = messages[0]["ts"]
+        return {
+            # A message that starts a group can later start a thread, the two
+            # documents must not replace each other
+            "id": f"{channel_id}:{kind}:{ts}",
+            "text": f"#{channel_name}\n" + "\n".join(self._format(m) for m in messages),
+            "metadata": {
+                "channel": channel_id,
+                "channel_name": channel_name,
+                "ts": ts,
+                "latest_ts": messages[-1]["ts"],
+                "kind": kind,
+                "messages": len(messages),
+            },
+        }
+
+    async def _fetch_new_messages(
+        self,
+        channel_id: str,
+        watermark: Optional[str],
+        thread_states: Dict[str, str],
+    ) -> List[Dict]:
+        if watermark is None:
+            oldest = _days_ago_ts(self.slack_context.history_seed_days)
+        else:
+            # Re-read recent threads too, they may have new replies
+            thread_window = _days_ago_ts(self.slack_context.history_thread_window_days)
+            oldest = min(watermark, thread_window, key=float)
+
+        messages = []
+        async for page in self.api.iter_history_pages(channel_id, oldest=oldest):
+            for message in page:
+                if message.get("subtype") in _SKIPPED_SUBTYPES:
+                    continue
+                is_new = watermark is None or float(message["ts"]) > float(watermark)
+                has_new_replies = message.get("reply_count") and float(
+                    message.get("latest_reply", "0")
+                ) > float(thread_states.get(message["ts"], "0"))
+                if is_new or has_new_replies:
+                    messages.append(message)
+        messages.sort(key=lambda m: float(m["ts"]))
+        return messages
+
+    async def ingest_channel(
+        self, channel_id: str, channel_name: str, batch_size: int = 50
+    ) -> int:
+        """
+        Ingest the messages of a channel newer than its watermark. Returns the
+        number of documents upserted.
+        """
+        watermark = self._get_watermark(channel_id)
+        thread_states = self._get_thread_states(channel_id)
+        messages = await self._fetch_new_messages(channel_id, watermark, thread_states)
+
+        documents = []
+        group = []
+        # Newest top-level message, and newest reply of the threads to flush
+        newest = watermark
+        latest_replies: Dict[str, str] = {}
+        upserted = 0
+
+        async def flush(watermark: Optional[str]):
+            nonlocal documents, upserted, latest_replies
+            if group:
+                documents.append(
+                    self._document(channel_id, channel_name, list(group), "messages")
+                )
+                group.clear()
+            if documents:
+                await asyncio.to_thread(self.store.upsert_documents, "slack", documents)
+                upserted += len(documents)
+                documents = []
+            if latest_replies:
+                self._set_thread_states(channel_id, latest_replies)
+                latest_replies = {}
+            if watermark:
+                self._set_watermark(channel_id, watermark)
+
+        for message in messages:
+            if message.get("reply_count"):
+                thread = await self.api.fetch_replies(channel_id, message["ts"])
+                thread = [
+                    m for m in thread if m.get("subtype") not in _SKIPPED_SUBTYPES
+                ]
+                documents.append(
+                    self._document(channel_id, channel_name, thread, "thread")
+                )
+                latest_replies[message["ts"]] = (
+                    message.get("latest_reply") or thread[-1]["ts"]
+                )
+            elif watermark is None or float(message["ts"]) > float(watermark):
+                text = self._format(message)
+                size = sum(len(self._format(m)) for m in group)
+                if group and size + len(text) > _MAX_CHUNK_CHARS:
+                    documents.append(
+                        self._document(
+                            channel_id, channel_name, list(group), "messages"
+                        )
+                    )
+                    group.clear()
+                group.append(message)
+
+            if newest is None or float(message["ts"]) > float(newest):
+                newest = message["ts"]
+            if len(documents) >= batch_size:
+                await flush(newest)
+
+        # The watermark only follows top-level messages: a reply can be newer
+        # than top-level messages posted after the history was read
+        await flush(newest)
+        return upserted
+
+    async def ingest(self, channels: List[SlackChannel]) -> Dict[str, int]:
+        """
+        Ingest the given channels, returning the number of documents upserted per
+        channel.
+        """
+        self._load_names()
+
+        results = {}
+        for channel in channels:
+            try:
+                results[channel.name] = await self.ingest_channel(
+                    channel.id, channel.name
+                )
+            except Exception as e:
+                print(f"Error ingesting Slack channel {channel.name}: {e}")
+        return results
@@ -0,0 +1,325 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import delete, or_, update
+from sqlmodel import SQLModel, Field, select
+
+from .db import session_scope
+from .executors import run_blocking
+
+# A job kind runs a request and returns its result. It gets a send callable for
+# its progress messages.
+JobRunner = Callable[[str, Callable[[str], Awaitable[None]]], Awaitable[str]]
+
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+class Job(SQLModel, table=True):
+    """
+    A long-running request executed in the background.
+
+    The process running a job (owner) holds a lease on it that it renews while
+    the job runs. Unfinished jobs whose lease expired, because their process
+    stopped or died, are run again by the next process that finds them.
+    """
+
+    id: str = Field(primary_key=True)
+    kind: str
+    request: str
+    status: str = Field(default="queued", index=True)
+    progress: Optional[str] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = Field(default=None, index=True)
+    owner: Optional[str] = None
+    # UTC, SQLite drops the timezone
+    lease_expires: Optional[datetime] = Field(default=None, index=True)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _save(job_id: str, **changes) -> Optional[Job]:
+    with session_scope() as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return None
+        for field, value in changes.items():
+            setattr(job, field, value)
+        session.add(job)
+        return job
+
+
+def _insert(job: Job) -> Job:
+    with session_scope() as session:
+        session.add(job)
+    return job
+
+
+def _get(job_id: str) -> Optional[Job]:
+    with session_scope() as session:
+        return session.get(Job, job_id)
+
+
+def _claim_expired(owner: str, lease: timedelta) -> List[Job]:
+    """Take over the unfinished jobs no live process holds a lease on"""
+    with session_scope() as session:
+        candidates = list(
+            session.exec(
+                select(Job)
+                .where(
+                    Job.status.in_(UNFINISHED_STATUSES),
+                    or_(Job.lease_expires.is_(None), Job.lease_expires < _utcnow()),
+                )
+                .order_by(Job.created_at)
+            )
+        )
+
+    claimed = []
+    for job in candidates:
+        # Each claim is a conditional update of its own, so when processes race
+        # for a job only one of them gets it
+        with session_scope() as session:
+            now = _utcnow()
+            result = session.exec(
+                update(Job)
+                .where(
+                    Job.id == job.id,
+                    Job.status.in_(UNFINISHED_STATUSES),
+                    or_(Job.lease_expires.is_(None), Job.lease_expires < now),
+                )
+                .values(owner=owner, lease_expires=now + lease)
+            )
+            if result.rowcount == 1:
+                claimed.append(job)
+    return claimed
+
+
+def _renew_leases(owner: str, job_ids: List[str], lease: timedelta) -> Set[str]:
+    """Extend the leases of the jobs, return the ids the owner still holds"""
+    with session_scope() as session:
+        session.exec(
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.owner == owner)
+            .values(lease_expires=_utcnow() + lease)
+        )
+        return set(
+            session.exec(select(Job.id).where(Job.id.in_(job_ids), Job.owner == owner))
+        )
+
+
+def _delete_finished_before(cutoff: datetime) -> int:
+    with session_scope() as session:
+        result = session.exec(
+            delete(Job).where(
+                Job.status.not_in(UNFINISHED_STATUSES), Job.finished_at < cutoff
+            )
+        )
+        return result.rowcount
+
+
+class JobManager:
+    """
+    Runs jobs as asyncio tasks, at most max_concurrency at a time, and keeps
+    their state in the Job table. Finished jobs are kept for retention_hours.
+
+    Several processes (e.g. stdio servers) can share the table: each one only
+    runs the jobs it holds the lease of, renewing it every lease_seconds / 3,
+    and takes over the jobs of the processes that stopped renewing theirs.
+
+        jobs = JobManager({"jira": run_jira}, max_concurrency=2)
+        await jobs.start()
+        job = await jobs.submit("jira", "good morning")
+    """
+
+    def __init__(
+        self,
+        runners: Dict[str, JobRunner],
+        max_concurrency: int = 2,
+        retention_hours: float = 24,
+        lease_seconds: float = 60,
+    ):
+        self.runners = runners
+        self.retention = timedelta(hours=retention_hours)
+        self.lease = timedelta(seconds=lease_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled = set()
+        self._lost = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        """
+        Drop the expired jobs, resume the ones whose process is gone and keep
+        the leases of the running ones alive.
+        """
+        await self.cleanup()
+        await self._resume_expired()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._keep_alive())
+
+    async def _resume_expired(self):
+        claimed = await run_blocking("database", _claim_expired, self.owner, self.lease)
+        for job in claimed:
+            if job.kind not in self.runners:
+                await run_blocking(
+                    "database",
+                    _save,
+                    job.id,
+                    status="failed",
+                    error=f"Unknown job kind {job.kind}",
+                    finished_at=datetime.now(),
+                )
+                continue
+            print(f"Resuming job {job.id} ({job.kind})")
+            await run_blocking("database", _save, job.id, status="queued")
+            self._schedule(job.id, job.kind, job.request)
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                job_ids = list(self._tasks)
+                if job_ids:
+                    held = await run_blocking(
+                        "database", _renew_leases, self.owner, job_ids, self.lease
+                    )
+                    # Stalled past the lease, another process runs them now
+                    for job_id in set(job_ids) - held:
+                        print(f"Lost the lease of job {job_id}, stopping it")
+                        self._lost.add(job_id)
+                        self._tasks[job_id].cancel()
+                await self._resume_expired()
+            except Exception as e:
+                print(f"Error renewing the job leases: {e}")
+
+    async def stop(self):
+        """
+        Interrupt the running jobs. They stay unfinished in the database and are
+        resumed by the next process that starts.
+        """
+        self._stopping = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def cleanup(self) -> int:
+        return await run_blocking(
+            "database", _delete_finished_before, datetime.now() - self.retention
+        )
+
+    def _schedule(self, job_id: str, kind: str, request: str):
+        task = asyncio.get_running_loop().create_task(self._run(job_id, kind, request))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def submit(self, kind: str, request: str) -> Job:
+        if kind not in self.runners:
+            raise ValueError(
+                f"Unknown job kind {kind}, expected one of {', '.join(self.runners)}"
+            )
+        if self._stopping:
+            raise RuntimeError("The server is shutting down, no new jobs are taken")
+        job = await run_blocking(
+            "database",
+            _insert,
+            Job(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                request=request,
+                owner=self.owner,
+                lease_expires=_utcnow() + self.lease,
+            ),
+        )
+        self._schedule(job.id, kind, request)
+        await self.cleanup()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await run_blocking("database", _get, job_id)
+
+    async def cancel(self, job_id: str) -> str:
+        """
+        Cancel a queued or running job of this process. Returns "cancelled",
+        "unknown", "finished" or "owned by another process".
+        """
+        task = self._tasks.get(job_id)
+        if task is None:
+            job = await self.get(job_id)
+            if job is None:
+                return "unknown"
+            if job.status not in UNFINISHED_STATUSES:
+                return "finished"
+            return "owned by another process"
+        self._cancelled.add(job_id)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return "cancelled"
+
+    async def _run(self, job_id: str, kind: str, request: str):
+        async def send(message: str):
+            await run_blocking("database", _save, job_id, progress=message)
+
+        try:
+            async with self._semaphore:
+                await run_blocking(
+                    "database",
+                    _save,
+                    job_id,
+                    status="running",
+                    started_at=datetime.now(),
+                )
+                result = await self.runners[kind](request, send)
+        except asyncio.CancelledError:
+            if job_id in self._lost:
+                self._lost.discard(job_id)
+            elif job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                await run_blocking(
+                    "database",
+                    _save,
+                    job_id,
+                    status="cancelled",
+                    finished_at=datetime.now(),
+                )
+            else:
+                # Interrupted by a shutdown, release it for the next process
+                await run_blocking(
+                    "database",
+                    _save,
+                    job_id,
+                    status="queued",
+                    owner=None,
+                    lease_expires=None,
+                )
+            raise
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {e}")
+            await run_blocking(
+                "database",
+                _save,
+                job_id,
+                status="failed",
+                error=str(e),
+                finished_at=datetime.now(),
+            )
+            return
+        await run_blocking(
+            "database",
+            _save,
+            job_id,
+            status="succeeded",
+            result=str(result),
+            finished_at=datetime.now(),
+        )
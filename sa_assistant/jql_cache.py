@@ -0,0 +1,228 @@
+import re
+import threading
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import SQLModel, Field
+
+from .context import AssistantContext
+from .db import get_session
+from .utils import name_to_email
+
+
+class JqlTranslation(SQLModel, table=True):
+    """
+    A natural language request and the JQL it was translated to. Absolute dates
+    the request does not spell out are stored as placeholders relative to the
+    day the translation was made.
+    """
+
+    request: str = Field(primary_key=True)
+    jql: str
+    hits: int = 0
+    created_at: datetime = Field(default_factory=datetime.now)
+    last_used_at: datetime = Field(default_factory=datetime.now)
+
+
+_FILLER_WORDS = {
+    "a",
+    "all",
+    "any",
+    "are",
+    "can",
+    "find",
+    "get",
+    "give",
+    "list",
+    "me",
+    "please",
+    "show",
+    "the",
+    "what",
+    "which",
+    "you",
+}
+_DATE_RE = re.compile(r"\b(\d{4})[-/](\d{2})[-/](\d{2})\b")
+_PLACEHOLDER_RE = re.compile(r"\{date:([+-]\d+)\}")
+_BOARD_RE = re.compile(r"\b(?:in|for|on|from)(?: the)? ([a-z]+)(?: board| project)?$")
+_CURRENT_SPRINT = "Sprint in openSprints()"
+
+
+def normalize_request(request: str) -> str:
+    """
+    Normalize a request so trivially different phrasings share a cache entry.
+    """
+    request = request.lower().replace("’", "'")
+    request = re.sub(r"[^\w\s'-]", " ", request)
+    words = [w for w in request.split() if w not in _FILLER_WORDS]
+    return " ".join(words)
+
+
+def _parse_date(match: re.Match) -> date:
+    return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+
+def to_template(jql: str, today: date, request: str = "") -> str:
+    """
+    Replace the absolute dates of a JQL query by placeholders relative to today.
+    Dates written in the request are kept as they are: they are part of the
+    cache key, so they mean the same day whenever the request is made again.
+    """
+    literal = {_parse_date(m) for m in _DATE_RE.finditer(request)}
+
+    def replace(match: re.Match) -> str:
+        value = _parse_date(match)
+        if value in literal:
+            return match.group(0)
+        return f"{{date:{(value - today).days:+d}}}"
+
+    return _DATE_RE.sub(replace, jql)
+
+
+def render_template(template: str, today: date) -> str:
+    def replace(match: re.Match) -> str:
+        value = date.fromordinal(today.toordinal() + int(match.group(1)))
+        return value.strftime("%Y-%m-%d")
+
+    return _PLACEHOLDER_RE.sub(replace, template)
+
+
+def _emails_clause(emails: List[str]) -> str:
+    quoted = ", ".join(f'"{e}"' for e in emails)
+    return f"assignee in ({quoted})"
+
+
+def _my_tickets(ctx: AssistantContext, match: re.Match) -> str:
+    return f"assignee = currentUser() AND {_CURRENT_SPRINT}"
+
+
+def _team_tickets(ctx: AssistantContext, match: re.Match) -> str:
+    emails = [name_to_email(member) for member in ctx.team]
+    return f"{_emails_clause(emails)} AND {_CURRENT_SPRINT}"
+
+
+def _member_tickets(ctx: AssistantContext, match: re.Match) -> Optional[str]:
+    name = match.group(1).strip()
+    for member in ctx.team + ctx.managers:
+        if member.lower() == name or member.split()[0].lower() == name:
+            return f'assignee = "{name_to_email(member)}" AND {_CURRENT_SPRINT}'
+    return None
+
+
+# Common requests from the jql_agent instructions that don't need an LLM turn
+_TEMPLATES: List[Tuple[re.Pattern, Callable[[AssistantContext, re.Match], str]]] = [
+    (re.compile(r"^my (?:open |current |sprint )*(?:tickets|issues)$"), _my_tickets),
+    (
+        re.compile(
+            r"^(?:my )?team(?:'s)? (?:current |sprint |open )*(?:tickets|issues)$"
+        ),
+        _team_tickets,
+    ),
+    (
+        re.compile(r"^tickets created (?:last|past|this) week$"),
+        lambda ctx, m: "created >= -7d",
+    ),
+    (
+        re.compile(r"^high priority bugs$"),
+        lambda ctx, m: "priority = High AND type = Bug",
+    ),
+    (
+        re.compile(r"^tickets updated today$"),
+        lambda ctx, m: "updated >= startOfDay()",
+    ),
+    (
+        re.compile(r"^([a-z]+(?: [a-z]+)?)'s? (?:current |sprint |open )*tickets$"),
+        _member_tickets,
+    ),
+]
+
+
+class JqlTranslationCache:
+    """
+    Translates common ticket requests to JQL without going through the
+    jql_agent, using fixed templates first and then the translations the agent
+    made before. Keeps hit/miss counters so the hit rate can be checked.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {"template_hits": 0, "cache_hits": 0, "misses": 0}
+
+    def _record(self, counter: str):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def _match_template(self, ctx: AssistantContext, request: str) -> Optional[str]:
+        # An optional trailing "in GROW" restricts the query to a board
+        board = None
+        match = _BOARD_RE.search(request)
+        if match and ctx.jira and match.group(1).upper() in ctx.jira.boards:
+            board = match.group(1).upper()
+            request = request[: match.start()].strip()
+
+        for pattern, build in _TEMPLATES:
+            match = pattern.match(request)
+            if not match:
+                continue
+            jql = build(ctx, match)
+            if jql is None:
+                continue
+            if board:
+                jql = f'project = "{board}" AND {jql}'
+            return jql
+        return None
+
+    def lookup(self, ctx: AssistantContext, request: str) -> Optional[str]:
+        """
+        Return the JQL for the request, or None if it has to be translated.
+        """
+        normalized = normalize_request(request)
+
+        jql = self._match_template(ctx, normalized)
+        if jql:
+            self._record("template_hits")
+            return jql
+
+        with get_session() as session:
+            translation = session.get(JqlTranslation, normalized)
+            if translation:
+                translation.hits += 1
+                translation.last_used_at = datetime.now()
+                session.add(translation)
+                session.commit()
+                self._record("cache_hits")
+                return render_template(translation.jql, date.today())
+
+        self._record("misses")
+        return None
+
+    def store(self, request: str, jql: str):
+        normalized = normalize_request(request)
+        if not normalized:
+            return
+        with get_session() as session:
+            session.merge(
+                JqlTranslation(
+                    request=normalized, jql=to_template(jql, date.today(), request)
+                )
+            )
+            session.commit()
+
+    def forget(self, request: str):
+        with get_session() as session:
+            translation = session.get(JqlTranslation, normalize_request(request))
+            if translation:
+                session.delete(translation)
+                session.commit()
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = sum(stats.values())
+        hits = stats["template_hits"] + stats["cache_hits"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+jql_cache = JqlTranslationCache()
@@ -0,0 +1,68 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+_current_reporter: ContextVar[Optional["ProgressReporter"]] = ContextVar(
+    "progress_reporter", default=None
+)
+
+
+class ProgressReporter:
+    """
+    Forwards the progress messages of a tool call to its client while the call
+    runs. Messages can be emitted from the event loop or from the worker threads
+    of run_blocking, and are sent in the order they were emitted.
+
+        async with ProgressReporter(send):
+            ...
+            report_progress("CRE: 3 tickets need attention")
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]]):
+        self._send = send
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._token = None
+
+    def emit(self, message: str):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._queue.put_nowait(message)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        except RuntimeError:
+            # The tool call is over, nobody is listening anymore
+            pass
+
+    async def _forward(self):
+        while (message := await self._queue.get()) is not None:
+            try:
+                await self._send(message)
+            except Exception as e:
+                print(f"Error sending progress: {e}")
+
+    async def __aenter__(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._forward())
+        self._token = _current_reporter.set(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        _current_reporter.reset(self._token)
+        self._queue.put_nowait(None)
+        await self._task
+
+
+def report_progress(message: str):
+    """
+    Send a progress message to the client of the current tool call, if it listens.
+    Safe to call from anywhere: without a reporter it does nothing.
+    """
+    reporter = _current_reporter.get()
+    if reporter is not None:
+        reporter.emit(message)
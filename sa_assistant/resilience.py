@@ -0,0 +1,388 @@
+import asyncio
+import functools
+import inspect
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import requests
+
+from .instrumentation import payload_size, record_span
+
+# Responses worth retrying: the request was not processed or the service hiccuped
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+_CONNECTION_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+)
+
+
+class CircuitOpenError(Exception):
+    """
+    The service failed repeatedly and calls to it are rejected for a while.
+    """
+
+    def __init__(self, service: str, retry_in: float):
+        super().__init__(
+            f"{service} is unavailable after repeated failures, "
+            f"not calling it again for {retry_in:.0f}s"
+        )
+        self.service = service
+        self.retry_in = retry_in
+
+
+class ServicePolicy:
+    """
+    How calls to a service are timed out, retried and short-circuited.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive transient failures and rejects
+    calls for reset_timeout seconds. Then a single trial call is let through:
+    it closes the circuit if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, service: str, policy: ServicePolicy):
+        self.service = service
+        self.policy = policy
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.policy.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_in = max(0.0, self.policy.reset_timeout - elapsed)
+        raise CircuitOpenError(self.service, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if (
+                self.state == "half_open"
+                or self.failures >= self.policy.failure_threshold
+            ):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        # The call failed for a reason that says nothing about the service health
+        with self._lock:
+            self._trial_running = False
+
+
+SERVICE_POLICIES: Dict[str, ServicePolicy] = {
+    "google": ServicePolicy(timeout=60),
+    "jira": ServicePolicy(timeout=30),
+    "asana": ServicePolicy(timeout=30),
+    "slack": ServicePolicy(timeout=30),
+    "openai": ServicePolicy(timeout=60, max_retries=2),
+}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_metrics: Dict[str, Dict[str, int]] = {}
+_lock = threading.Lock()
+
+
+def get_policy(service: str) -> ServicePolicy:
+    with _lock:
+        if service not in SERVICE_POLICIES:
+            SERVICE_POLICIES[service] = ServicePolicy()
+        return SERVICE_POLICIES[service]
+
+
+def get_timeout(service: str) -> float:
+    return get_policy(service).timeout
+
+
+def _get_breaker(service: str) -> CircuitBreaker:
+    policy = get_policy(service)
+    with _lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service, policy)
+        return _breakers[service]
+
+
+def _record(service: str, counter: str):
+    with _lock:
+        metrics = _metrics.setdefault(
+            service,
+            {
+                "calls": 0,
+                "successes": 0,
+                "failures": 0,
+                "retries": 0,
+                "rejected": 0,
+            },
+        )
+        metrics[counter] += 1
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Call counters and circuit state per service.
+    """
+    with _lock:
+        stats = {service: dict(metrics) for service, metrics in _metrics.items()}
+        breakers = dict(_breakers)
+    for service, breaker in breakers.items():
+        stats.setdefault(service, {})["circuit"] = breaker.state
+    return stats
+
+
+def _get_status(error: BaseException) -> Optional[int]:
+    # Asana ApiException / aiohttp, JIRAError / openai, googleapiclient HttpError,
+    # SlackApiError, requests HTTPError
+    for attribute in ("status", "status_code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    for attribute in ("resp", "response"):
+        response = getattr(error, attribute, None)
+        for status in ("status", "status_code"):
+            value = getattr(response, status, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _get_retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        response = getattr(error, "response", None) or getattr(error, "resp", None)
+        headers = getattr(response, "headers", None)
+        if headers is None and isinstance(response, dict):
+            # googleapiclient keeps the headers on the response itself
+            headers = response
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def classify(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    Return whether the error is transient, and the delay the service asked for.
+    """
+    if isinstance(error, (CircuitOpenError, asyncio.CancelledError)):
+        return False, None
+    if isinstance(error, (*_CONNECTION_ERRORS, asyncio.TimeoutError)):
+        return True, None
+    # SDK specific connection errors (aiohttp, openai, httplib2...)
+    name = type(error).__name__
+    if "Connection" in name or "Timeout" in name:
+        return True, None
+    status = _get_status(error)
+    if status in RETRYABLE_STATUSES:
+        return True, _get_retry_after(error)
+    return False, None
+
+
+def _trace_attempt(
+    service: str,
+    func: Callable,
+    started_at: float,
+    started: float,
+    attempt: int,
+    result: Any = None,
+    error: Optional[BaseException] = None,
+):
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    attributes = {"service": service, "attempt": attempt}
+    if error is not None:
+        attributes["error"] = type(error).__name__
+        status = _get_status(error)
+        if status is not None:
+            attributes["status"] = status
+    else:
+        size = payload_size(result)
+        if size is not None:
+            attributes["response_size"] = size
+    record_span(
+        "http",
+        f"{service}:{name}",
+        started_at,
+        (time.perf_counter() - started) * 1000,
+        **attributes,
+    )
+
+
+def _record_outcome(breaker: CircuitBreaker, error: BaseException, transient: bool):
+    # A rate limit means the service is up and answering: the call is retried
+    # after Retry-After, but it must not open the circuit for everyone else
+    if transient and _get_status(error) != 429:
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+def _delay(policy: ServicePolicy, attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return min(retry_after, policy.max_delay)
+    # Full jitter, so clients that failed together do not retry together
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2**attempt))
+
+
+def _should_retry(
+    error: BaseException, idempotent: bool, attempt: int, policy: ServicePolicy
+) -> Tuple[bool, bool, Optional[float]]:
+    """
+    Return (retry, transient, retry_after) for a failed attempt.
+    """
+    transient, retry_after = classify(error)
+    if not transient or attempt >= policy.max_retries:
+        return False, transient, retry_after
+    # A write may have been applied before it failed, only retry it when the
+    # service says it was not processed
+    if not idempotent and _get_status(error) != 429:
+        return False, transient, retry_after
+    return True, transient, retry_after
+
+
+def call(service: str, func: Callable, *args, idempotent: bool = True, **kwargs):
+    """
+    Call func with retries and the circuit breaker of the service.
+    """
+    policy = get_policy(service)
+    breaker = _get_breaker(service)
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            _record(service, "rejected")
+            raise
+        _record(service, "calls")
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            _trace_attempt(service, func, started_at, started, attempt, error=e)
+            retry, transient, retry_after = _should_retry(
+                e, idempotent, attempt, policy
+            )
+            _record_outcome(breaker, e, transient)
+            if not retry:
+                _record(service, "failures")
+                raise
+            _record(service, "retries")
+            time.sleep(_delay(policy, attempt, retry_after))
+            attempt += 1
+            continue
+        _trace_attempt(service, func, started_at, started, attempt, result=result)
+        breaker.record_success()
+        _record(service, "successes")
+        return result
+
+
+async def acall(
+    service: str,
+    func: Callable[..., Awaitable],
+    *args,
+    idempotent: bool = True,
+    **kwargs,
+):
+    """
+    Await func with the timeout, retries and circuit breaker of the service.
+    """
+    policy = get_policy(service)
+    breaker = _get_breaker(service)
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            _record(service, "rejected")
+            raise
+        _record(service, "calls")
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), policy.timeout)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            _trace_attempt(service, func, started_at, started, attempt, error=e)
+            retry, transient, retry_after = _should_retry(
+                e, idempotent, attempt, policy
+            )
+            _record_outcome(breaker, e, transient)
+            if not retry:
+                _record(service, "failures")
+                raise
+            _record(service, "retries")
+            await asyncio.sleep(_delay(policy, attempt, retry_after))
+            attempt += 1
+            continue
+        _trace_attempt(service, func, started_at, started, attempt, result=result)
+        breaker.record_success()
+        _record(service, "successes")
+        return result
+
+
+def resilient(service: str, idempotent: bool = True):
+    """
+    Run every call of the decorated function through call/acall.
+
+        @resilient("google")
+        def get_events(self, ...): ...
+    """
+
+    def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await acall(
+                    service, func, *args, idempotent=idempotent, **kwargs
+                )
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return call(service, func, *args, idempotent=idempotent, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from .cache import make_key
+
+
+class _Call:
+    """
+    A call in flight, shared by every caller that asks for the same thing.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, counter: str):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"calls": 0, "coalesced": 0})
+        stats[counter] += 1
+
+
+def get_singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Upstream calls made and calls that joined one already in flight, per function.
+    """
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def singleflight(func: Callable):
+    """
+    Coalesce concurrent identical calls: while a call is in flight, callers with
+    the same arguments (normalized like the response cache keys) wait for it and
+    share its result or exception instead of sending their own request.
+
+    The result is shared, so callers must not mutate it. Works on sync functions,
+    across threads, and on async functions, within an event loop.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    if inspect.iscoroutinefunction(func):
+        tasks: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            key = (loop, make_key(func, args, kwargs))
+            task = tasks.get(key)
+            if task is None:
+                _record(name, "calls")
+                # A task of its own, so a cancelled caller does not cancel the
+                # others
+                task = loop.create_task(func(*args, **kwargs))
+                tasks[key] = task
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+            else:
+                _record(name, "coalesced")
+            return await asyncio.shield(task)
+
+        return async_wrapper
+
+    calls: Dict[str, _Call] = {}
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = make_key(func, args, kwargs)
+        with lock:
+            call = calls.get(key)
+            leader = call is None
+            if leader:
+                call = calls[key] = _Call()
+
+        if not leader:
+            _record(name, "coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        _record(name, "calls")
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with lock:
+                del calls[key]
+            call.done.set()
+
+    return wrapper
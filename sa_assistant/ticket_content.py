@@ -0,0 +1,185 @@
+import hashlib
+import re
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Rough characters-per-token ratio used when tiktoken is not available
+_CHARS_PER_TOKEN = 4
+
+_CODE_BLOCK_RE = re.compile(
+    r"(\{code(?::[^}]*)?\}.*?\{code\}|\{noformat\}.*?\{noformat\}|```.*?```)",
+    re.DOTALL,
+)
+_QUOTE_BLOCK_RE = re.compile(r"\{quote\}.*?\{quote\}", re.DOTALL)
+_STACK_FRAME_RE = re.compile(
+    r"^\s*(at [\w$.<>]+\(.*\)|File \".*\", line \d+.*|\.\.\. \d+ more|"
+    r"Caused by: .*|Traceback \(most recent call last\):)\s*$"
+)
+_QUOTED_LINE_RE = re.compile(r"^\s*(>|bq\.\s)")
+_BOT_AUTHOR_RE = re.compile(r"\b(bot|automation|jenkins|github|ci)\b", re.IGNORECASE)
+
+
+class TicketComment(BaseModel):
+    """
+    A comment attached to a ticket, reduced to what the analysis needs.
+    """
+
+    author: str = ""
+    body: str = ""
+    is_bot: bool = False
+
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """
+    Keep the head of the text so it fits into max_tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * _CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars].rstrip() + " [...]"
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + " [...]"
+
+
+def _collapse_stack_traces(text: str) -> str:
+    lines = []
+    frames = 0
+    for line in text.splitlines():
+        if _STACK_FRAME_RE.match(line):
+            frames += 1
+            continue
+        if frames:
+            lines.append(f"[stack trace: {frames} lines omitted]")
+            frames = 0
+        lines.append(line)
+    if frames:
+        lines.append(f"[stack trace: {frames} lines omitted]")
+    return "\n".join(lines)
+
+
+def _collapse_quoted_lines(text: str) -> str:
+    lines = []
+    quoted = False
+    for line in text.splitlines():
+        if _QUOTED_LINE_RE.match(line):
+            if not quoted:
+                lines.append("[quoted reply omitted]")
+            quoted = True
+            continue
+        quoted = False
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def collapse_noise(text: str) -> str:
+    """
+    Collapse code blocks, stack traces and quoted replies into short markers, so
+    the analysis budget is spent on what people actually wrote.
+    """
+    if not text:
+        return ""
+    text = _CODE_BLOCK_RE.sub("[code block omitted]", text)
+    text = _QUOTE_BLOCK_RE.sub("[quoted reply omitted]", text)
+    text = _collapse_stack_traces(text)
+    text = _collapse_quoted_lines(text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def _fingerprint(text: str) -> str:
+    # Bots usually repeat the same message with different numbers/ids in it
+    normalized = re.sub(r"\d+", "#", text.lower())
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def is_bot_author(author: str, account_type: Optional[str] = None) -> bool:
+    if account_type == "app":
+        return True
+    return bool(author and _BOT_AUTHOR_RE.search(author))
+
+
+def build_ticket_content(
+    summary: str,
+    description: str,
+    comments: List[TicketComment],
+    model: str,
+    token_budget: int = 3000,
+    max_comments: int = 10,
+    description_share: float = 0.4,
+) -> str:
+    """
+    Build the text sent to the AI analysis for a ticket, bounded by token_budget.
+
+    The summary is always kept. The head of the description gets up to
+    description_share of the remaining budget, and the rest is filled with the
+    most recent max_comments comments (newest first while filling, rendered in
+    chronological order). Repeated bot comments are only kept once.
+    """
+    summary = (summary or "").strip()
+    parts_budget = token_budget - count_tokens(summary, model)
+
+    description = collapse_noise(description or "")
+    description = truncate_to_tokens(
+        description, int(parts_budget * description_share), model
+    )
+    remaining = parts_budget - count_tokens(description, model)
+
+    # Walk comments from the newest one so the recent discussion wins the budget
+    seen_bot_messages = set()
+    selected = []
+    for comment in reversed(comments):
+        if len(selected) >= max_comments or remaining <= 0:
+            break
+        body = collapse_noise(comment.body)
+        if not body:
+            continue
+        if comment.is_bot:
+            fingerprint = _fingerprint(body)
+            if fingerprint in seen_bot_messages:
+                continue
+            seen_bot_messages.add(fingerprint)
+        text = f"{comment.author}: {body}" if comment.author else body
+        text = truncate_to_tokens(text, remaining, model)
+        remaining -= count_tokens(text, model)
+        selected.append(text)
+
+    omitted = len(comments) - len(selected)
+    sections = [f"Summary: {summary}"]
+    if description:
+        sections.append(f"Description: {description}")
+    if selected:
+        header = "Comments (most recent)"
+        if omitted > 0:
+            header += f", {omitted} older comments omitted"
+        sections.append(header + ":\n" + "\n".join(reversed(selected)))
+    return "\n\n".join(sections)
@@ -5,6 +5,7 @@ import pytz
 
 from agents import RunContextWrapper, function_tool
 from sa_assistant.context import AssistantContext
+from sa_assistant.executors import run_blocking
 from sa_assistant.integrations.asana import AsanaAPI
 from sa_assistant.integrations.google.calendar import GoogleCalendarAPI
 from sa_assistant.utils import name_to_email
@@ -60,9 +61,15 @@ async def daily_calendar_check(
         date_obj = now
 
     calendar_api = GoogleCalendarAPI()
-    asana_api = AsanaAPI(ctx.context.asana.api_token, ctx.context.asana.team_id)
+    asana_api = AsanaAPI(
+        ctx.context.asana.api_token,
+        ctx.context.asana.team_id,
+        projects_ttl=ctx.context.asana.projects_ttl,
+    )
 
-    calendar_events = calendar_api.get_events(
+    calendar_events = await run_blocking(
+        "google",
+        calendar_api.get_events,
         calendar_id="primary",
         time_min=(
             date_obj.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
@@ -84,10 +91,20 @@ async def daily_calendar_check(
         attendees = [a for a in event.attendees if a and a not in manager_emails]
         if len(attendees) == 1:
             event_type = DailyCheckEventType.ONE_TO_ONE
-            projects = asana_api.get_projects_with_users([attendees[0]])
-            for project in projects:
-                tasks = asana_api.get_tasks_by_project(project.gid)
-                asana_tasks.extend(tasks)
+            projects = await run_blocking(
+                "asana", asana_api.get_projects_with_users, [attendees[0]]
+            )
+            asana_tasks.extend(
+                await run_blocking(
+                    "asana",
+                    lambda: list(
+                        asana_api.iter_tasks_by_projects(
+                            [p.gid for p in projects],
+                            max_age=ctx.context.asana.tasks_max_age,
+                        )
+                    ),
+                )
+            )
         else:
             event_type = DailyCheckEventType.TEAM_MEETING
 
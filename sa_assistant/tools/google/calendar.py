@@ -3,6 +3,7 @@ from agents import function_tool, RunContextWrapper
 from sa_assistant.integrations.google.calendar import GoogleCalendarAPI
 
 from ...context import AssistantContext
+from ...executors import run_blocking
 
 
 @function_tool
@@ -19,7 +20,9 @@ async def get_calendar_event(ctx: RunContextWrapper[AssistantContext], date_str:
     time_min = date.isoformat() + "Z"
     time_max = (date + timedelta(days=days_ahead)).isoformat() + "Z"
     try:
-        events = GoogleCalendarAPI().get_events(
+        events = await run_blocking(
+            "google",
+            GoogleCalendarAPI().get_events,
             calendar_id,
             time_min=time_min,
             time_max=time_max,
@@ -73,7 +76,9 @@ async def create_calendar_event(
         event["attendees"] = [{"email": email} for email in attendees]
 
     try:
-        return GoogleCalendarAPI().create_event(calendar_id, event)
+        return await run_blocking(
+            "google", GoogleCalendarAPI().create_event, calendar_id, event
+        )
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
@@ -88,6 +93,8 @@ async def delete_calendar_event(
         event_id: The ID of the event to delete
     """
     try:
-        GoogleCalendarAPI().delete_event(event_id, "primary")
+        await run_blocking(
+            "google", GoogleCalendarAPI().delete_event, event_id, "primary"
+        )
     except Exception as e:
         return {"status": "error", "error": str(e), "event_id": event_id}
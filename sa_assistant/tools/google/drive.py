@@ -2,6 +2,7 @@ from agents import function_tool, RunContextWrapper
 from sa_assistant.integrations.google.drive import GoogleDriveAPI
 
 from ...context import AssistantContext
+from ...executors import run_blocking
 
 
 @function_tool
@@ -14,7 +15,9 @@ async def create_drive_file(
         file_name: The name of the file
         file_content: The content of the file
     """
-    return GoogleDriveAPI().create_file(file_name, file_content)
+    return await run_blocking(
+        "google", GoogleDriveAPI().create_file, file_name, file_content
+    )
 
 
 @function_tool
@@ -24,17 +27,22 @@ async def delete_drive_file(ctx: RunContextWrapper[AssistantContext], file_id: s
     Args:
         file_id: The ID of the file to delete
     """
-    return GoogleDriveAPI().delete_file(file_id)
+    return await run_blocking("google", GoogleDriveAPI().delete_file, file_id)
 
 
 @function_tool
-async def list_files_in_path(ctx: RunContextWrapper[AssistantContext], path: str):
+async def list_files_in_path(
+    ctx: RunContextWrapper[AssistantContext], path: str, recursive: bool = False
+):
     """List files in the drive.
 
     Args:
         path: The path to the folder to list files in
+        recursive: If True, also lists the files of every subfolder
     """
-    return GoogleDriveAPI().list_files_in_path(path)
+    return await run_blocking(
+        "google", GoogleDriveAPI().list_files_in_path, path, recursive
+    )
 
 
 @function_tool
@@ -47,6 +55,8 @@ async def read_drive_file_by_path(
         file_path: The path to the file to read
     """
     try:
-        return GoogleDriveAPI().download_file_by_path(file_path)
+        return await run_blocking(
+            "google", GoogleDriveAPI().download_file_by_path, file_path
+        )
     except Exception as e:
         return {"status": "error", "error": str(e), "file_path": file_path}
@@ -1,8 +1,16 @@
+from collections import defaultdict
+
 from agents import function_tool, RunContextWrapper
-from jira import JIRA
+from jira.exceptions import JIRAError
 from pydantic import BaseModel, Field
 
-from ..context import AssistantContext
+from ..cache import cached
+from ..context import AssistantContext, JiraContext
+from ..executors import run_blocking
+from ..integrations.jira import get_jira_api
+from ..integrations.jira_mirror import UnsupportedQuery, get_jira_mirror, parse_sprint
+from ..jql_cache import jql_cache
+from ..singleflight import singleflight
 
 
 class TicketInfo(BaseModel):
@@ -15,22 +23,46 @@ class TicketInfo(BaseModel):
     )
 
 
-@function_tool
-async def get_tickets(
-    ctx: RunContextWrapper[AssistantContext], jql: str
-) -> list[TicketInfo]:
-    """Get tickets based on a JQL query."""
+class FastPathResult(BaseModel):
+    hit: bool = Field(description="Whether the request could be answered directly")
+    jql: str | None = Field(default=None, description="The JQL query that was run")
+    tickets: list[TicketInfo] = Field(default_factory=list)
+
+
+@cached("jira.tickets", ttl=60, stale_ttl=240, persist=False)
+@singleflight
+def fetch_tickets(jira_context: JiraContext, jql: str) -> list[TicketInfo]:
+    """Fetch the tickets matching the JQL query, from the mirror when possible."""
+
+    # Answer from the local mirror when it can express the query
     try:
-        jira = JIRA(
-            server=ctx.context.jira.base_url,
-            basic_auth=(ctx.context.jira.api_email, ctx.context.jira.api_key),
+        issues = get_jira_mirror(jira_context).query(
+            jql, limit=jira_context.max_results
         )
+        return [
+            TicketInfo(
+                key=issue.key,
+                summary=issue.summary,
+                status=issue.status,
+                assignee=issue.assignee or "Unassigned",
+                story_points=issue.story_points,
+            )
+            for issue in issues
+        ]
+    except UnsupportedQuery:
+        pass
     except Exception as e:
-        print(e)
-        return []
+        print(f"Error querying the Jira mirror, falling back to Jira: {e}")
 
-    # Get tickets based on the JQL query
-    issues = jira.search_issues(jql)
+    api = get_jira_api(jira_context)
+
+    # Only request the fields we read, and page through the whole result set
+    issues = api.search_issues(
+        jql,
+        fields=["summary", "status", "assignee", jira_context.story_points_field],
+        limit=jira_context.max_results,
+        page_size=jira_context.page_size,
+    )
 
     data = [
         TicketInfo(
@@ -42,9 +74,198 @@ async def get_tickets(
                 if issue.fields.assignee
                 else "Unassigned"
             ),
-            story_points=getattr(issue.fields, "customfield_10708", None),
+            story_points=getattr(issue.fields, jira_context.story_points_field, None),
         )
         for issue in issues
     ]
 
     return data
+
+
+@function_tool
+async def get_tickets(
+    ctx: RunContextWrapper[AssistantContext], jql: str, request: str = ""
+) -> list[TicketInfo]:
+    """Get tickets based on a JQL query.
+
+    Args:
+        jql: The JQL query.
+        request: The user's original request the query was translated from, so the
+            translation can be reused next time.
+    """
+    tickets = await run_blocking("jira", fetch_tickets, ctx.context.jira, jql)
+    if request and tickets:
+        await run_blocking("database", jql_cache.store, request, jql)
+    return tickets
+
+
+@function_tool
+async def find_tickets_by_request(
+    ctx: RunContextWrapper[AssistantContext], request: str
+) -> FastPathResult:
+    """Get tickets for a common request (e.g. "my tickets", "my team's tickets")
+    without translating it to JQL. If hit is false, the request has to be
+    translated to JQL first.
+
+    Args:
+        request: The user's request, as they phrased it.
+    """
+    jql = await run_blocking("database", jql_cache.lookup, ctx.context, request)
+    if jql is None:
+        return FastPathResult(hit=False)
+
+    try:
+        tickets = await run_blocking("jira", fetch_tickets, ctx.context.jira, jql)
+    except JIRAError as e:
+        # The cached query is no longer valid (e.g. a renamed status)
+        print(f"Cached JQL failed, forgetting it: {e}")
+        await run_blocking("database", jql_cache.forget, request)
+        return FastPathResult(hit=False)
+
+    return FastPathResult(hit=True, jql=jql, tickets=tickets)
+
+
+class CapacityRow(BaseModel):
+    name: str = Field(description="Assignee, status or sprint the row aggregates")
+    tickets: int = 0
+    total_points: float = 0
+    done_points: float = 0
+    remaining_points: float = 0
+    unestimated_tickets: int = Field(
+        default=0, description="Tickets without story points"
+    )
+
+
+class CapacitySummary(BaseModel):
+    jql: str = Field(description="The JQL query the tickets were selected with")
+    totals: CapacityRow
+    by_assignee: list[CapacityRow]
+    by_status: list[CapacityRow]
+    by_sprint: list[CapacityRow]
+    team_load: list[CapacityRow] = Field(
+        description="Points per team member, including members with no tickets"
+    )
+    table: str = Field(description="Markdown table of the load per assignee")
+    truncated: bool = Field(
+        default=False,
+        description="More tickets matched than could be counted, the totals are "
+        "a lower bound",
+    )
+
+
+def _add_to_row(row: CapacityRow, points: float | None, done: bool):
+    row.tickets += 1
+    if points is None:
+        row.unestimated_tickets += 1
+        return
+    row.total_points += points
+    if done:
+        row.done_points += points
+    else:
+        row.remaining_points += points
+
+
+def _to_markdown(rows: list[CapacityRow]) -> str:
+    lines = [
+        "| Assignee | Tickets | Points | Done | Remaining | Unestimated |",
+        "|---|---|---|---|---|---|",
+    ]
+    for row in rows:
+        lines.append(
+            f"| {row.name} | {row.tickets} | {row.total_points:g} | "
+            f"{row.done_points:g} | {row.remaining_points:g} | "
+            f"{row.unestimated_tickets} |"
+        )
+    return "\n".join(lines)
+
+
+# Only a few small fields are fetched per ticket, so every page is read
+CAPACITY_MAX_ISSUES = 100_000
+
+
+def aggregate_capacity(
+    jira_context: JiraContext, team: list[str], jql: str
+) -> CapacitySummary:
+    """
+    Aggregate the story points of the tickets matching the JQL query by
+    assignee, status and sprint, without returning the tickets themselves.
+    """
+    api = get_jira_api(jira_context)
+    issues = api.search_issues(
+        jql,
+        fields=[
+            "status",
+            "assignee",
+            jira_context.story_points_field,
+            jira_context.sprint_field,
+        ],
+        limit=CAPACITY_MAX_ISSUES,
+        page_size=jira_context.page_size,
+    )
+
+    totals = CapacityRow(name="Total")
+    by_assignee = defaultdict(lambda: CapacityRow(name=""))
+    by_status = defaultdict(lambda: CapacityRow(name=""))
+    by_sprint = defaultdict(lambda: CapacityRow(name=""))
+    for issue in issues:
+        fields = issue.raw["fields"]
+        status = fields.get("status") or {}
+        done = (status.get("statusCategory") or {}).get("key") == "done"
+        assignee = (fields.get("assignee") or {}).get("displayName") or "Unassigned"
+        points = fields.get(jira_context.story_points_field)
+        points = float(points) if points is not None else None
+        sprints = [parse_sprint(s) for s in fields.get(jira_context.sprint_field) or []]
+        active = [s for s in sprints if s.get("state") == "active"]
+        sprint = (active or sprints)[-1].get("name") if sprints else "Backlog"
+
+        _add_to_row(totals, points, done)
+        for rows, name in (
+            (by_assignee, assignee),
+            (by_status, status.get("name", "Unknown")),
+            (by_sprint, sprint),
+        ):
+            rows[name].name = name
+            _add_to_row(rows[name], points, done)
+
+    # Team members are matched on their display name
+    assignees = {name.lower(): row for name, row in by_assignee.items()}
+    team_load = [
+        assignees.get(member.lower(), CapacityRow(name=member)) for member in team
+    ]
+
+    by_assignee_rows = sorted(
+        by_assignee.values(), key=lambda r: r.remaining_points, reverse=True
+    )
+    return CapacitySummary(
+        jql=jql,
+        totals=totals,
+        by_assignee=by_assignee_rows,
+        by_status=sorted(by_status.values(), key=lambda r: r.name),
+        by_sprint=sorted(by_sprint.values(), key=lambda r: r.name),
+        team_load=team_load,
+        table=_to_markdown(by_assignee_rows + [totals]),
+        truncated=totals.tickets >= CAPACITY_MAX_ISSUES,
+    )
+
+
+@function_tool
+async def get_sprint_capacity(
+    ctx: RunContextWrapper[AssistantContext], board: str = "", jql: str = ""
+) -> CapacitySummary:
+    """Get the story points and load of the team for the current sprint, by
+    assignee, status and sprint. Use this for capacity or backlog questions
+    instead of fetching the tickets.
+
+    Args:
+        board: The Jira board to check. If not provided, all configured boards.
+        jql: Optional JQL query selecting the tickets, replacing the default
+            current sprint query (e.g. to look at a backlog).
+    """
+    if not jql:
+        boards = [board] if board else ctx.context.jira.boards
+        projects = ", ".join(f'"{b}"' for b in boards)
+        jql = f"project in ({projects}) AND Sprint in openSprints()"
+
+    return await run_blocking(
+        "jira", aggregate_capacity, ctx.context.jira, ctx.context.team, jql
+    )
@@ -1,22 +1,29 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Iterable
+
+from sqlalchemy.dialects.sqlite import insert
 from sqlmodel import select
 from agents import RunContextWrapper, function_tool
 
-from sa_assistant.context import AssistantContext
-from sa_assistant.db import get_session
+from sa_assistant.context import AssistantContext, SlackContext
+from sa_assistant.db import session_scope
 from sa_assistant.integrations.slack import (
     SlackAPI,
     SlackChannel,
     SlackChat,
     SlackConversation,
 )
+from sa_assistant.integrations.slack_history import SlackHistoryIngester
+from sa_assistant.singleflight import singleflight
+from sa_assistant.utils import name_to_email
 
 
 def fetch_channel(
     channel_id: str | None = None, channel_name: str | None = None
 ) -> SlackChannel:
-    db_session = get_session()
-
-    with db_session as session:
+    with session_scope() as session:
         statement = None
         if channel_id:
             statement = select(SlackChannel).where(SlackChannel.id == channel_id)
@@ -28,9 +35,7 @@ def fetch_channel(
 
 
 def fetch_chat(chat_name: str) -> SlackChat:
-    db_session = get_session()
-
-    with db_session as session:
+    with session_scope() as session:
         statement = select(SlackChat).where(SlackChat.name == chat_name)
         results = session.exec(statement)
 
@@ -44,38 +49,241 @@ def fetch_conversation(conversation_id: str) -> SlackChannel | SlackChat:
     return fetch_chat(conversation_id)
 
 
+def _upsert_statement(model: type[SlackChannel] | type[SlackChat]):
+    statement = insert(model)
+    columns = [c.name for c in model.__table__.columns if not c.primary_key]
+    return statement.on_conflict_do_update(
+        index_elements=["id"],
+        set_={column: statement.excluded[column] for column in columns},
+    )
+
+
+def _save_page(session, page: list[SlackChannel | SlackChat]):
+    for model in (SlackChannel, SlackChat):
+        rows = [c.model_dump() for c in page if isinstance(c, model)]
+        if rows:
+            session.execute(_upsert_statement(model), rows)
+
+
+def save_conversation_pages(pages: Iterable[list[SlackChannel | SlackChat]]):
+    """
+    Insert or update the conversations of every page in a single transaction,
+    with one executemany per page and table.
+    """
+    with session_scope() as session:
+        for page in pages:
+            _save_page(session, page)
+
+
 def save_conversations(conversations: list[SlackChannel | SlackChat]):
-    db_session = get_session()
+    save_conversation_pages([conversations])
+
+
+@singleflight
+async def sync_conversations(api: SlackAPI):
+    """
+    Re-sync every channel and user of the workspace into the database.
+    """
+    # Download first so the write lock is not held while waiting on Slack
+    pages = [page async for page in api.iter_channel_pages()]
+    pages += [page async for page in api.iter_chat_pages()]
+    save_conversation_pages(pages)
 
-    with db_session as session:
+
+class SlackResolver:
+    """
+    In-memory index of the Slack directory, keyed by ID, name and real name.
+
+    The index is loaded from the database and refreshed in the background, so
+    resolving a conversation does not touch SQLite or Slack. Only an unknown
+    name triggers a targeted Slack call, whose result is saved and indexed.
+    """
+
+    def __init__(self, slack_token: str, refresh_interval: int = 3600):
+        self.api = SlackAPI(slack_token)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._thread = None
+        self._channels_by_id: Dict[str, SlackChannel] = {}
+        self._channels_by_name: Dict[str, SlackChannel] = {}
+        self._chats_by_id: Dict[str, SlackChat] = {}
+        self._chats_by_name: Dict[str, SlackChat] = {}
+
+    @staticmethod
+    def _add_to_index(
+        conversations: Iterable[SlackChannel | SlackChat],
+        channels_by_id: Dict[str, SlackChannel],
+        channels_by_name: Dict[str, SlackChannel],
+        chats_by_id: Dict[str, SlackChat],
+        chats_by_name: Dict[str, SlackChat],
+    ):
         for conversation in conversations:
-            session.add(conversation)
+            if isinstance(conversation, SlackChannel):
+                channels_by_id[conversation.id] = conversation
+                channels_by_name[conversation.name.lower()] = conversation
+            else:
+                chats_by_id[conversation.id] = conversation
+                if conversation.name:
+                    chats_by_name[conversation.name.lower()] = conversation
+                if conversation.real_name:
+                    # Real names are not unique, keep the first one seen
+                    chats_by_name.setdefault(
+                        conversation.real_name.lower(), conversation
+                    )
 
-        session.commit()
+    def _index(self, conversations: Iterable[SlackChannel | SlackChat]):
+        with self._lock:
+            self._add_to_index(
+                conversations,
+                self._channels_by_id,
+                self._channels_by_name,
+                self._chats_by_id,
+                self._chats_by_name,
+            )
 
+    def load(self):
+        """
+        (Re)build the index from the conversations stored in the database.
+        """
+        with session_scope() as session:
+            channels = list(session.exec(select(SlackChannel)))
+            chats = list(session.exec(select(SlackChat)))
 
-def get_conversation(slack_token: str, conversation_id: str) -> SlackConversation:
-    api = SlackAPI(slack_token)
-    result = None
-    conversation_name = conversation_id[1:]
-    if conversation_id.startswith("#"):
-        result = fetch_channel(channel_name=conversation_name)
-        if not result:
-            api_conversations = api.fetch_channels()
-            save_conversations(api_conversations)
-            result = fetch_channel(channel_name=conversation_name)
-    else:
-        result = fetch_chat(chat_name=conversation_name)
-        if not result:
-            api_conversations = api.fetch_chats()
-            save_conversations(api_conversations)
-            result = fetch_chat(chat_name=conversation_name)
+        # Built aside and swapped in at once, lookups never see a partial index
+        indexes = ({}, {}, {}, {})
+        self._add_to_index(channels, *indexes)
+        self._add_to_index(chats, *indexes)
+        with self._lock:
+            (
+                self._channels_by_id,
+                self._channels_by_name,
+                self._chats_by_id,
+                self._chats_by_name,
+            ) = indexes
+        self._loaded = True
+
+    async def refresh(self):
+        await sync_conversations(self.api)
+        self.load()
+
+    def _refresh_loop(self):
+        # The refresh thread keeps its own event loop, and so its own session
+        loop = asyncio.new_event_loop()
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                loop.run_until_complete(self.refresh())
+            except Exception as e:
+                print(f"Error refreshing the Slack directory: {e}")
+
+    def start(self):
+        """
+        Load the index and keep it refreshed from a background thread.
+        """
+        if not self._loaded:
+            self.load()
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
+
+    def _lookup(self, conversation_id: str) -> SlackConversation | None:
+        key = conversation_id[1:].lower()
+        with self._lock:
+            if conversation_id.startswith("#"):
+                return self._channels_by_name.get(key)
+            if conversation_id.startswith("@"):
+                return self._chats_by_name.get(key)
+            return self._channels_by_id.get(conversation_id) or self._chats_by_id.get(
+                conversation_id
+            )
+
+    async def _fetch(self, conversation_id: str) -> SlackConversation | None:
+        name = conversation_id[1:]
+        if conversation_id.startswith("@"):
+            email = name if "@" in name else name_to_email(name)
+            return await self.api.lookup_user_by_email(email)
+        if not conversation_id.startswith("#"):
+            return await self.api.fetch_channel_info(conversation_id)
+
+        # There is no lookup by channel name, walk the pages until it shows up
+        async for page in self.api.iter_channel_pages():
+            save_conversations(page)
+            self._index(page)
+            for channel in page:
+                if channel.name.lower() == name.lower():
+                    return channel
+        return None
+
+    async def resolve(self, conversation_id: str) -> SlackConversation | None:
+        """
+        Resolve a channel (#name), a user (@name, @real name or @email) or a
+        conversation ID to the stored conversation.
+        """
+        if not self._loaded:
+            self.load()
+
+        result = self._lookup(conversation_id)
+        if result:
+            return result
 
-    return result
+        result = await self._fetch(conversation_id)
+        if result:
+            save_conversations([result])
+            self._index([result])
+        return result
+
+
+_resolvers: Dict[str, SlackResolver] = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_slack_resolver(slack_token: str, refresh_interval: int = 3600) -> SlackResolver:
+    """
+    Get the shared SlackResolver for the given token, creating it on first use.
+    """
+    with _resolvers_lock:
+        if slack_token not in _resolvers:
+            _resolvers[slack_token] = SlackResolver(slack_token, refresh_interval)
+        return _resolvers[slack_token]
+
+
+async def ingest_slack_history(slack_context: SlackContext, store) -> Dict[str, int]:
+    """
+    Ingest the new messages of the slack.history_channels into the "slack"
+    source of the vector store.
+    """
+    resolver = get_slack_resolver(
+        slack_context.api_token, slack_context.directory_refresh_interval
+    )
+    channels = []
+    for conversation_id in slack_context.history_channels:
+        channel = await resolver.resolve(conversation_id)
+        if isinstance(channel, SlackChannel):
+            channels.append(channel)
+        else:
+            print(f"Slack channel {conversation_id} not found, skipping")
+
+    ingester = SlackHistoryIngester(resolver.api, store, slack_context)
+    return await ingester.ingest(channels)
+
+
+async def close_slack_clients():
+    """
+    Close the HTTP sessions of the shared Slack clients on the running loop.
+    """
+    with _resolvers_lock:
+        resolvers = list(_resolvers.values())
+    for resolver in resolvers:
+        await resolver.api.close()
+
+
+async def get_conversation(slack_token: str, conversation_id: str) -> SlackConversation:
+    return await get_slack_resolver(slack_token).resolve(conversation_id)
 
 
 @function_tool
-def send_message(
+async def send_message(
     ctx: RunContextWrapper[AssistantContext], message: str, conversation_id: str = None
 ):
     """Sends a message to Slack
@@ -85,8 +293,49 @@ def send_message(
         conversation_id: Conversation ID that represents a channel (prefixed with #) or a chat (prefixed with @).
     """
 
-    slack_token = ctx.context.slack.api_token
-    channel = get_conversation(slack_token, conversation_id)
-    api = SlackAPI(slack_token)
+    resolver = get_slack_resolver(
+        ctx.context.slack.api_token, ctx.context.slack.directory_refresh_interval
+    )
+    channel = await resolver.resolve(conversation_id)
+    if not channel:
+        return f"Could not find the Slack conversation {conversation_id}"
+
+    await resolver.api.send_message(channel.id, message)
+
+
+@function_tool
+async def send_messages(
+    ctx: RunContextWrapper[AssistantContext],
+    message: str,
+    conversation_ids: list[str],
+):
+    """Sends the same message to several Slack conversations at once
+
+    Args:
+        message: The content of the message.
+        conversation_ids: Conversation IDs that represent a channel (prefixed with #) or a chat (prefixed with @).
+    """
+
+    resolver = get_slack_resolver(
+        ctx.context.slack.api_token, ctx.context.slack.directory_refresh_interval
+    )
+    channels = await asyncio.gather(*(resolver.resolve(c) for c in conversation_ids))
+
+    results = []
+    targets = []
+    for conversation_id, channel in zip(conversation_ids, channels):
+        if channel:
+            targets.append((conversation_id, channel))
+        else:
+            results.append(f"{conversation_id}: not found")
+
+    sent = await resolver.api.send_messages(
+        [(channel.id, message) for _, channel in targets]
+    )
+    for (conversation_id, _), result in zip(targets, sent):
+        if isinstance(result, Exception):
+            results.append(f"{conversation_id}: failed ({result})")
+        else:
+            results.append(f"{conversation_id}: sent")
 
-    api.send_message(channel.id, message)
+    return "\n".join(results)
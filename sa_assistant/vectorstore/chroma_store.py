@@ -1,4 +1,12 @@
-from typing import List, Dict, Optional
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from ..context import VectorStoreContext
+from .embedding_cache import get_embedding_cache
+from .encoder import SentenceTransformer, get_encoder
 
 try:
     import chromadb
@@ -7,17 +15,33 @@ except ImportError:
     chromadb = None
     Settings = None
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    SentenceTransformer = None
+
+def content_hash(document: Dict) -> str:
+    """Hash of what gets stored for a document: its text and its metadata"""
+    metadata = json.dumps(document.get("metadata", {}), sort_keys=True, default=str)
+    payload = f"{document['text']}\x1f{metadata}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 class VectorStore:
+    @classmethod
+    def from_context(cls, context: VectorStoreContext) -> "VectorStore":
+        return cls(
+            persist_directory=context.persist_directory,
+            embedding_model=context.embedding_model,
+            device=context.device,
+            batch_size=context.batch_size,
+            num_threads=context.num_threads,
+        )
+
     def __init__(
         self,
         persist_directory: Optional[str] = None,
         embedding_model: str = "all-MiniLM-L6-v2",
+        embedding_cache_size: int = 200_000,
+        device: Optional[str] = None,
+        batch_size: int = 64,
+        num_threads: Optional[int] = None,
     ):
         if chromadb is None or Settings is None:
             raise ImportError(
@@ -28,33 +52,143 @@ class VectorStore:
                 "sentence-transformers is not installed. "
                 "Please install it to use VectorStore."
             )
-        self.client = chromadb.PersistentClient(
-            path=persist_directory or ".vector_store"
+        persist_directory = persist_directory or ".vector_store"
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self.embedding_model_name = embedding_model
+        # Loaded on first encode and shared with the other stores of the process
+        self.embedding_model = get_encoder(embedding_model, device, num_threads)
+        self.batch_size = batch_size
+        # Embeddings are shared by every collection of the store, 0 disables it
+        self.embedding_cache = (
+            get_embedding_cache(
+                os.path.join(persist_directory, "embeddings"), embedding_cache_size
+            )
+            if embedding_cache_size
+            else None
         )
-        self.embedding_model = SentenceTransformer(embedding_model)
-        self.collections = {}
+        # Collections persisted by earlier processes, opened on first use.
+        # list_collections returns names on chromadb < 0.6, collections after.
+        self.collections = {
+            getattr(collection, "name", collection): None
+            for collection in self.client.list_collections()
+        }
 
     def _get_collection(self, source: str):
-        if source not in self.collections:
+        if self.collections.get(source) is None:
             self.collections[source] = self.client.get_or_create_collection(source)
         return self.collections[source]
 
+    def _embed(
+        self, texts: List[str], batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        batch_size = batch_size or self.batch_size
+        if self.embedding_cache is None:
+            return self.embedding_model.encode(texts, batch_size=batch_size).tolist()
+
+        vectors = self.embedding_cache.get_many(self.embedding_model_name, texts)
+        # Texts repeated in the call are embedded once
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            computed = self.embedding_model.encode(missing, batch_size=batch_size)
+            self.embedding_cache.put_many(self.embedding_model_name, missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [
+                by_text[text] if vector is None else vector
+                for text, vector in zip(texts, vectors)
+            ]
+        return [vector.tolist() for vector in vectors]
+
     def add_documents(self, source: str, documents: List[Dict]):
+        self.ingest(source, documents)
+
+    def upsert_documents(
+        self, source: str, documents: List[Dict], batch_size: Optional[int] = None
+    ):
+        """
+        Insert the documents, replacing the ones whose id is already stored.
+        Texts are embedded batch_size at a time.
+        """
+        self.ingest(source, documents, batch_size=batch_size)
+
+    def ingest(
+        self,
+        source: str,
+        documents: Iterable[Dict],
+        batch_size: Optional[int] = None,
+        write_batch_size: int = 1024,
+    ) -> Dict[str, float]:
+        """
+        Bulk insert or update documents ({"id", "text", "metadata"}) read from any
+        iterable, so a large source never has to fit in memory.
+
+        Documents are written write_batch_size at a time, each batch in a single
+        upsert, and embedded batch_size (the store's batch size by default) at a
+        time. Documents whose text and metadata did not change since they were
+        stored are skipped without being embedded. Returns counters: seen,
+        skipped, written and seconds.
+        """
         collection = self._get_collection(source)
-        texts = [doc["text"] for doc in documents]
-        ids = [doc["id"] for doc in documents]
-        metadatas = [doc.get("metadata", {}) for doc in documents]
-        embeddings = self.embedding_model.encode(texts).tolist()
-        collection.add(
-            embeddings=embeddings, documents=texts, metadatas=metadatas, ids=ids
+        write_batch_size = min(write_batch_size, self.client.get_max_batch_size())
+        stats = {"seen": 0, "skipped": 0, "written": 0, "seconds": 0.0}
+        started = time.perf_counter()
+
+        batch: Dict[str, Dict] = {}
+        for doc in documents:
+            stats["seen"] += 1
+            # The last version of a document wins, an upsert rejects duplicate ids
+            batch.pop(doc["id"], None)
+            batch[doc["id"]] = doc
+            if len(batch) >= write_batch_size:
+                self._write_batch(collection, list(batch.values()), batch_size, stats)
+                batch = {}
+        if batch:
+            self._write_batch(collection, list(batch.values()), batch_size, stats)
+
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+    def _write_batch(
+        self,
+        collection,
+        documents: List[Dict],
+        batch_size: Optional[int],
+        stats: Dict,
+    ):
+        metadatas = [
+            {**doc.get("metadata", {}), "content_hash": content_hash(doc)}
+            for doc in documents
+        ]
+        stored = collection.get(
+            ids=[doc["id"] for doc in documents], include=["metadatas"]
+        )
+        stored_hashes = {
+            id: (metadata or {}).get("content_hash")
+            for id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+        changed = [
+            (doc, metadata)
+            for doc, metadata in zip(documents, metadatas)
+            if stored_hashes.get(doc["id"]) != metadata["content_hash"]
+        ]
+        stats["skipped"] += len(documents) - len(changed)
+        if not changed:
+            return
+
+        texts = [doc["text"] for doc, _ in changed]
+        collection.upsert(
+            embeddings=self._embed(texts, batch_size),
+            documents=texts,
+            metadatas=[metadata for _, metadata in changed],
+            ids=[doc["id"] for doc, _ in changed],
         )
+        stats["written"] += len(changed)
 
     def search(
         self, query: str, source: Optional[str] = None, top_k: int = 5
     ) -> List[Dict]:
         sources = [source] if source else self.collections.keys()
         results = []
-        query_embedding = self.embedding_model.encode([query]).tolist()[0]
+        query_embedding = self._embed([query])[0]
         for src in sources:
             collection = self._get_collection(src)
             res = collection.query(query_embeddings=[query_embedding], n_results=top_k)
@@ -0,0 +1,313 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, a cache directory cannot be shared between processes there
+    fcntl = None
+
+# The index lives next to the vectors it points into, so a cache directory is
+# self-contained: copying, deleting or pointing another store at it can never
+# pair rows with the vectors of another file.
+INDEX_FILE = "index.sqlite3"
+LOCK_FILE = "lock"
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    model TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    dim INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _ModelEmbeddings:
+    """
+    The embeddings of one model: float32 vectors appended to a file read through
+    a memory map, and an in-memory copy of their index.
+
+    Each compaction writes a new generation of the file. The index records the
+    generation its rows point into, so rows are never read from another file.
+    """
+
+    def __init__(self, model: str, directory: str, index: sqlite3.Connection):
+        self.model = model
+        self.directory = directory
+        self.index = index
+        self._load_index()
+
+    def _file_path(self, generation: int) -> str:
+        file_name = re.sub(r"[^\w.-]", "_", self.model)
+        return os.path.join(self.directory, f"{file_name}.{generation}.f32")
+
+    def _stored_file(self):
+        return self.index.execute(
+            "SELECT generation, dim FROM files WHERE model = ?", (self.model,)
+        ).fetchone()
+
+    def _load_index(self):
+        self.rows: Dict[str, int] = {}
+        self.used_at: Dict[str, float] = {}
+        self.dead_rows = 0
+        self._map: Optional[np.memmap] = None
+
+        stored = self._stored_file()
+        self.generation, self.dim = stored if stored else (0, None)
+        self.path = self._file_path(self.generation)
+        if stored and not os.path.exists(self.path):
+            # The vectors are gone, their rows would point into nothing
+            with self.index:
+                self.index.execute("DELETE FROM entries WHERE model = ?", (self.model,))
+                self.index.execute("DELETE FROM files WHERE model = ?", (self.model,))
+            self.generation, self.dim = 0, None
+            return
+
+        total_rows = self.total_rows()
+        entries = self.index.execute(
+            "SELECT text_hash, row, used_at FROM entries WHERE model = ?",
+            (self.model,),
+        ).fetchall()
+        for h, row, used_at in entries:
+            # Entries past the end of the file were never fully written
+            if row < total_rows:
+                self.rows[h] = row
+                self.used_at[h] = used_at
+        self.dead_rows = total_rows - len(self.rows)
+
+    def reload_if_compacted(self):
+        """Another process sharing the directory may have created or compacted it"""
+        stored = self._stored_file()
+        if stored and (stored[0] != self.generation or self.dim is None):
+            self._load_index()
+
+    def total_rows(self) -> int:
+        if self.dim is None or not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (4 * self.dim)
+
+    def read(self, rows: List[int]) -> np.ndarray:
+        if self._map is None or self._map.shape[0] <= max(rows):
+            # The file grew since it was mapped
+            self._map = np.memmap(
+                self.path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self.total_rows(), self.dim),
+            )
+        return np.array(self._map[rows])
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Append the vectors to the file, return the row of the first one"""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with self.index:
+                self.index.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                    (self.model, self.generation, self.dim),
+                )
+        first_row = self.total_rows()
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        return first_row
+
+    def save(self, hashes: List[str], evicted: List[str]):
+        with self.index:
+            self.index.executemany(
+                "DELETE FROM entries WHERE model = ? AND text_hash = ?",
+                [(self.model, h) for h in evicted],
+            )
+            self.index.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                [(self.model, h, self.rows[h], self.used_at[h]) for h in hashes],
+            )
+
+    def compact(self):
+        """
+        Write the live vectors to the next generation of the file. Must be called
+        with the directory lock held.
+        """
+        # Other processes may have added entries since the index was loaded
+        used_at = self.used_at
+        self._load_index()
+        for h, last_used in used_at.items():
+            if h in self.used_at:
+                self.used_at[h] = max(self.used_at[h], last_used)
+
+        keep = list(self.rows)
+        rows = {}
+        generation = self.generation + 1
+        path = self._file_path(generation)
+        with open(path, "wb") as f:
+            for start in range(0, len(keep), 4096):
+                hashes = keep[start : start + 4096]
+                f.write(self.read([self.rows[h] for h in hashes]).tobytes())
+                for offset, h in enumerate(hashes):
+                    rows[h] = start + offset
+
+        # The index switches to the new file in a single transaction, a crash
+        # before the commit leaves it pointing at the old, intact one
+        with self.index:
+            self.index.execute("DELETE FROM entries WHERE model = ?", (self.model,))
+            self.index.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                [(self.model, h, row, self.used_at[h]) for h, row in rows.items()],
+            )
+            self.index.execute(
+                "UPDATE files SET generation = ? WHERE model = ?",
+                (generation, self.model),
+            )
+        old_path = self.path
+        self.generation, self.path, self.rows = generation, path, rows
+        self.dead_rows = 0
+        self._map = None
+        os.remove(old_path)
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings keyed by (model name, sha256 of the text), so
+    a text that was embedded once, in any collection, is never embedded again.
+
+    Vectors are appended to a float32 file per model and read through a memory
+    map. The index (row of each hash) is a SQLite file in the same directory.
+    Writers, in this process or others sharing the directory, take a lock on it
+    from reading the size of the file to saving the rows they appended.
+    Past max_entries, the least recently used entries are evicted, and the file
+    is compacted once it holds more dead rows than live ones.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 200_000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._models: Dict[str, _ModelEmbeddings] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "compactions": 0}
+        os.makedirs(directory, exist_ok=True)
+        # Only used under the lock
+        self._index = sqlite3.connect(
+            os.path.join(directory, INDEX_FILE), check_same_thread=False
+        )
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA busy_timeout=5000")
+        self._index.executescript(_SCHEMA)
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+
+    @contextmanager
+    def _directory_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _get_model(self, model: str) -> _ModelEmbeddings:
+        if model not in self._models:
+            self._models[model] = _ModelEmbeddings(model, self.directory, self._index)
+        else:
+            self._models[model].reload_if_compacted()
+        return self._models[model]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached embedding of each text, None where there is none"""
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            embeddings = self._get_model(model)
+            now = time.time()
+            found = {}
+            for h in set(hashes):
+                if h in embeddings.rows:
+                    found[h] = embeddings.rows[h]
+                    # Recency of reads is only tracked in memory, after a restart
+                    # eviction goes by the time entries were written
+                    embeddings.used_at[h] = now
+            vectors = {}
+            if found:
+                rows = embeddings.read(list(found.values()))
+                vectors = dict(zip(found, rows))
+            result = [vectors.get(h) for h in hashes]
+            hits = sum(vector is not None for vector in result)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(result) - hits
+        return result
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._directory_lock():
+            embeddings = self._get_model(model)
+            new = {}
+            for text, vector in zip(texts, vectors):
+                h = text_hash(text)
+                if h not in embeddings.rows:
+                    new[h] = vector
+            if not new:
+                return
+
+            first_row = embeddings.append(np.stack(list(new.values())))
+            now = time.time()
+            for offset, h in enumerate(new):
+                embeddings.rows[h] = first_row + offset
+                embeddings.used_at[h] = now
+            evicted = self._evict(embeddings)
+            embeddings.save([h for h in new if h in embeddings.rows], evicted)
+
+            if embeddings.dead_rows > max(len(embeddings.rows), 1024):
+                embeddings.compact()
+                self.stats["compactions"] += 1
+
+    def _evict(self, embeddings: _ModelEmbeddings) -> List[str]:
+        if len(embeddings.rows) <= self.max_entries:
+            return []
+        # Evict down to 90% so the next puts do not evict again right away
+        count = len(embeddings.rows) - int(self.max_entries * 0.9)
+        evicted = sorted(embeddings.used_at, key=embeddings.used_at.get)[:count]
+        for h in evicted:
+            del embeddings.rows[h]
+            del embeddings.used_at[h]
+        embeddings.dead_rows += len(evicted)
+        self.stats["evictions"] += len(evicted)
+        return evicted
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = sum(len(m.rows) for m in self._models.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(directory: str, max_entries: int = 200_000) -> EmbeddingCache:
+    """
+    Get the cache stored in the directory, shared by every store using it.
+    """
+    directory = os.path.abspath(directory)
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = EmbeddingCache(directory, max_entries)
+        return _caches[directory]
@@ -0,0 +1,82 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+class SharedEncoder:
+    """
+    A SentenceTransformer loaded on first use and shared by every VectorStore of
+    the process using the same model and device.
+
+    Inference is serialized: the model is not safe to call from several threads
+    at once, and one call already uses every thread torch is given.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        device: Optional[str] = None,
+        num_threads: Optional[int] = None,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.num_threads = num_threads
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    if SentenceTransformer is None:
+                        raise ImportError(
+                            "sentence-transformers is not installed. "
+                            "Please install it to use VectorStore."
+                        )
+                    if self.num_threads:
+                        import torch
+
+                        torch.set_num_threads(self.num_threads)
+                    print(f"Loading embedding model {self.model_name}")
+                    self._model = SentenceTransformer(
+                        self.model_name, device=self.device
+                    )
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def encode(self, texts: List[str], batch_size: int = 64):
+        model = self.model
+        with self._encode_lock:
+            return model.encode(texts, batch_size=batch_size)
+
+    def warm_up(self):
+        """Load the model and run a first encode, which is slower than the next"""
+        self.encode(["warm up"])
+
+
+_encoders: Dict[Tuple[str, Optional[str]], SharedEncoder] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(
+    model_name: str,
+    device: Optional[str] = None,
+    num_threads: Optional[int] = None,
+) -> SharedEncoder:
+    """
+    Get the shared encoder of the model, the model itself is loaded on first use.
+    """
+    with _encoders_lock:
+        key = (model_name, device)
+        if key not in _encoders:
+            _encoders[key] = SharedEncoder(model_name, device, num_threads)
+        return _encoders[key]
@@ -1,5 +1,13 @@
-from agents import Runner, RunConfig
-from mcp.server.fastmcp import FastMCP
+import argparse
+import asyncio
+import functools
+import threading
+import time
+from typing import Dict
+
+import uvicorn
+from agents import ItemHelpers, Runner, RunConfig
+from mcp.server.fastmcp import Context, FastMCP
 from sa_assistant import (
     calendar_agent,
     jira_agent,
@@ -7,76 +15,407 @@ from sa_assistant import (
     drive_agent,
     daily_calendar_check_agent,
 )
+from sa_assistant.context import AssistantContext, ServerContext
+from sa_assistant import instrumentation
+from sa_assistant.cache import get_cache_stats
+from sa_assistant.executors import get_pool_stats, run_blocking
+from sa_assistant.instrumentation import (
+    InstrumentationHooks,
+    get_instrumentation_stats,
+    span,
+    trace,
+)
+from sa_assistant.jql_cache import jql_cache
+from sa_assistant.jobs import UNFINISHED_STATUSES, Job, JobManager
+from sa_assistant.progress import ProgressReporter
+from sa_assistant.resilience import get_resilience_stats
+from sa_assistant.singleflight import get_singleflight_stats
+from sa_assistant.tools.slack import close_slack_clients, get_slack_resolver
+from sa_assistant.vectorstore.encoder import get_encoder
 from sa_assistant.utils import load_config_and_setup_env
 
 # Create an MCP server
 mcp = FastMCP("StackAdapt Assistant")
 
 
-async def run_agent(agent, request):
+# Per-tool limits and in-flight calls, shared by every session of the process
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_in_flight = 0
+_draining = False
+
+
+@functools.cache
+def get_context() -> AssistantContext:
+    """Load the configuration once, every session shares the same context"""
     config, context = load_config_and_setup_env()
+    return context
+
+
+def _get_semaphore(tool: str, server_context: ServerContext) -> asyncio.Semaphore:
+    if tool not in _semaphores:
+        limit = server_context.tool_limits.get(tool, server_context.tool_concurrency)
+        _semaphores[tool] = asyncio.Semaphore(limit)
+    return _semaphores[tool]
+
+
+def _describe_event(event, tool_names: Dict[str, str]) -> str | None:
+    """Turn a streamed run event into a progress message for the client"""
+    if event.type == "agent_updated_stream_event":
+        return f"Handing off to {event.new_agent.name}"
+    if event.type != "run_item_stream_event":
+        return None
+
+    item = event.item
+    if event.name == "tool_called":
+        name = getattr(item.raw_item, "name", None) or "tool"
+        call_id = getattr(item.raw_item, "call_id", None)
+        if call_id:
+            tool_names[call_id] = name
+        return f"Calling {name}"
+    if event.name == "tool_output":
+        call_id = (
+            item.raw_item.get("call_id")
+            if isinstance(item.raw_item, dict)
+            else getattr(item.raw_item, "call_id", None)
+        )
+        return f"{tool_names.get(call_id, 'tool')} finished"
+    if event.name == "message_output_created":
+        return ItemHelpers.text_message_output(item) or None
+    return None
+
+
+def _client_progress(ctx: Context):
+    """Send progress messages to the MCP client of a tool call"""
+    step = 0
+
+    async def send(message: str):
+        nonlocal step
+        step += 1
+        # Progress notifications for the clients that asked for them, log
+        # messages for the others
+        await ctx.report_progress(step, message=message)
+        await ctx.info(message)
+
+    return send
+
+
+async def _ignore_progress(message: str):
+    pass
+
+
+async def run_agent(tool, agent, request, send=_ignore_progress):
+    global _in_flight
+
+    if _draining:
+        return "The assistant is shutting down, please retry in a moment."
+
+    context = get_context()
 
     # Create RunConfig with the model from context
     run_config = RunConfig(model=context.openai_model)
 
-    result = await Runner.run(agent, request, context=context, run_config=run_config)
-    return result.final_output
+    semaphore = _get_semaphore(tool, context.server)
+    _in_flight += 1
+    try:
+        with trace(tool) as trace_id:
+            with span("queue", tool):
+                await semaphore.acquire()
+            try:
+                async with ProgressReporter(send) as progress:
+                    result = Runner.run_streamed(
+                        agent,
+                        request,
+                        context=context,
+                        run_config=run_config,
+                        hooks=InstrumentationHooks(),
+                    )
+                    tool_names: Dict[str, str] = {}
+                    async for event in result.stream_events():
+                        if event.type == "agent_updated_stream_event" and (
+                            event.new_agent is agent
+                        ):
+                            continue
+                        message = _describe_event(event, tool_names)
+                        if message:
+                            progress.emit(message)
+            finally:
+                semaphore.release()
+        if context.server.instrumentation_dir:
+            await run_blocking(
+                "instrumentation",
+                instrumentation.export,
+                context.server.instrumentation_dir,
+                trace_id,
+            )
+        return result.final_output
+    finally:
+        _in_flight -= 1
 
 
 @mcp.tool()
-async def calendar(request: str):
+async def calendar(request: str, ctx: Context):
     """StackAdapt Calendar agent. In charge of performing all tasks related to calendars
     Args:
         request: The user request that we will need to handle.
     """
-    result = await run_agent(calendar_agent, request)
+    result = await run_agent("calendar", calendar_agent, request, _client_progress(ctx))
 
     return result
 
 
 @mcp.tool()
-async def jira(request: str):
+async def jira(request: str, ctx: Context):
     """StackAdapt Jira agent. In charge of performing all tasks related to Jira tickets
     Args:
         request: The user request that we will need to handle.
     """
-    result = await run_agent(jira_agent, request)
+    result = await run_agent("jira", jira_agent, request, _client_progress(ctx))
 
     return result
 
 
 @mcp.tool()
-async def slack(request: str):
+async def slack(request: str, ctx: Context):
     """StackAdapt Slack agent. In charge of performing all tasks related to Slack messaging
     Args:
         request: The user request that we will need to handle.
     """
-    result = await run_agent(slack_agent, request)
+    result = await run_agent("slack", slack_agent, request, _client_progress(ctx))
 
     return result
 
 
 @mcp.tool()
-async def drive(request: str):
+async def drive(request: str, ctx: Context):
     """StackAdapt Drive agent. In charge of performing all tasks related to Google Drive
     Args:
         request: The user request that we will need to handle.
     """
-    result = await run_agent(drive_agent, request)
+    result = await run_agent("drive", drive_agent, request, _client_progress(ctx))
 
     return result
 
 
 @mcp.tool()
-async def daily_calendar_check(request: str):
+async def daily_calendar_check(request: str, ctx: Context):
     """StackAdapt Daily calendar check agent. In charge of performing all tasks related to daily calendar checks
     Args:
         request: The user request that we will need to handle.
     """
-    result = await run_agent(daily_calendar_check_agent, request)
+    result = await run_agent(
+        "daily_calendar_check",
+        daily_calendar_check_agent,
+        request,
+        _client_progress(ctx),
+    )
 
     return result
 
 
+# Tools that can also run as background jobs
+AGENTS = {
+    "calendar": calendar_agent,
+    "jira": jira_agent,
+    "slack": slack_agent,
+    "drive": drive_agent,
+    "daily_calendar_check": daily_calendar_check_agent,
+}
+
+
+@functools.cache
+def get_job_manager() -> JobManager:
+    server_context = get_context().server
+    return JobManager(
+        {
+            tool: functools.partial(run_agent, tool, agent)
+            for tool, agent in AGENTS.items()
+        },
+        max_concurrency=server_context.job_concurrency,
+        retention_hours=server_context.job_retention_hours,
+        lease_seconds=server_context.job_lease_seconds,
+    )
+
+
+def _describe_job(job: Job) -> dict:
+    return job.model_dump(
+        mode="json", include={"id", "kind", "status", "progress", "created_at"}
+    )
+
+
+@mcp.tool()
+async def submit(tool: str, request: str):
+    """Run a request in the background, for tasks that take minutes like a good morning
+    analysis over several boards or a recursive Drive listing. Returns a job id to
+    follow with status and result.
+    Args:
+        tool: The tool that handles the request: calendar, jira, slack, drive or daily_calendar_check
+        request: The user request that we will need to handle.
+    """
+    try:
+        job = await get_job_manager().submit(tool, request)
+    except (ValueError, RuntimeError) as e:
+        return {"error": str(e)}
+    return _describe_job(job)
+
+
+@mcp.tool()
+async def status(job_id: str):
+    """Status and latest progress message of a background job
+    Args:
+        job_id: The id returned by submit
+    """
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        return {"error": f"Unknown job {job_id}"}
+    return _describe_job(job)
+
+
+@mcp.tool()
+async def result(job_id: str):
+    """Result of a background job, once its status is succeeded or failed
+    Args:
+        job_id: The id returned by submit
+    """
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        return {"error": f"Unknown job {job_id}"}
+    if job.status in UNFINISHED_STATUSES:
+        return {**_describe_job(job), "error": "The job is not finished yet"}
+    return job.model_dump(
+        mode="json", include={"id", "status", "result", "error", "finished_at"}
+    )
+
+
+@mcp.tool()
+async def cancel(job_id: str):
+    """Cancel a queued or running background job
+    Args:
+        job_id: The id returned by submit
+    """
+    outcome = await get_job_manager().cancel(job_id)
+    if outcome == "unknown":
+        return {"error": f"Unknown job {job_id}"}
+    if outcome == "finished":
+        return {"error": f"Job {job_id} is not queued or running"}
+    if outcome != "cancelled":
+        return {
+            "error": f"Job {job_id} is running in another server process, "
+            "it can only be cancelled there"
+        }
+    return {"id": job_id, "status": "cancelled"}
+
+
+@mcp.tool()
+async def stats():
+    """Latency, token and saturation statistics of the assistant: per tool, LLM turn
+    and upstream call latencies, caches, JQL translation hit rate, coalesced
+    calls, circuit breakers and thread pools. Use it to find where the time goes.
+    """
+    return {
+        **get_instrumentation_stats(),
+        "caches": get_cache_stats(),
+        "jql_translations": jql_cache.get_stats(),
+        "singleflight": get_singleflight_stats(),
+        "resilience": get_resilience_stats(),
+        "pools": get_pool_stats(),
+    }
+
+
+class _GracefulServer(uvicorn.Server):
+    """
+    Stops taking new tool calls and lets the in-flight ones finish before the
+    HTTP server shuts down.
+    """
+
+    def __init__(self, config: uvicorn.Config, shutdown_timeout: float):
+        super().__init__(config)
+        self.shutdown_timeout = shutdown_timeout
+
+    async def shutdown(self, sockets=None):
+        global _draining
+
+        _draining = True
+        # Jobs are resumed on the next start, they do not hold the shutdown
+        await get_job_manager().stop()
+        deadline = time.monotonic() + self.shutdown_timeout
+        while _in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if _in_flight:
+            print(f"Shutting down with {_in_flight} tool calls still running")
+        await super().shutdown(sockets=sockets)
+
+
+async def serve_http(transport: str, host: str, port: int, shutdown_timeout: int):
+    """Serve every MCP client from this process over HTTP"""
+    if transport == "sse":
+        app = mcp.sse_app()
+    else:
+        app = mcp.streamable_http_app()
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        log_level=mcp.settings.log_level.lower(),
+        # Only open streams are left once the tool calls are drained
+        timeout_graceful_shutdown=5,
+    )
+    await get_job_manager().start()
+    try:
+        await _GracefulServer(config, shutdown_timeout).serve()
+    finally:
+        await close_slack_clients()
+
+
+async def serve_stdio():
+    """Serve a single MCP client over stdin/stdout"""
+    await get_job_manager().start()
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await get_job_manager().stop()
+        await close_slack_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StackAdapt Assistant MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse", "streamable-http"],
+        default="stdio",
+        help="stdio serves a single client, sse and streamable-http serve many",
+    )
+    parser.add_argument("--host", help="Defaults to server.host in config.yaml")
+    parser.add_argument("--port", type=int, help="Defaults to server.port")
+    args = parser.parse_args()
+
+    # Warm the Slack directory so send_message never waits for it
+    context = get_context()
+    get_slack_resolver(
+        context.slack.api_token, context.slack.directory_refresh_interval
+    ).start()
+
+    if context.vector_store.warm_up:
+        encoder = get_encoder(
+            context.vector_store.embedding_model,
+            context.vector_store.device,
+            context.vector_store.num_threads,
+        )
+        threading.Thread(target=encoder.warm_up, daemon=True).start()
+
+    if args.transport == "stdio":
+        asyncio.run(serve_stdio())
+        return
+
+    asyncio.run(
+        serve_http(
+            args.transport,
+            args.host or context.server.host,
+            args.port or context.server.port,
+            context.server.shutdown_timeout,
+        )
+    )
+
+
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    main()
@@ -5,6 +5,7 @@ from sa_assistant.integrations.google.docs import GoogleDocsAPI
 from sa_assistant.vectorstore.chroma_store import VectorStore
 from sa_assistant.agents.daily_check import daily_calendar_check_agent
 from sa_assistant.integrations.asana import AsanaAPI
+from sa_assistant.tools.slack import ingest_slack_history
 from sa_assistant.utils import load_config_and_setup_env
 from sa_assistant.context import AssistantContext
 import sa_assistant
@@ -88,29 +89,30 @@ async def test_vector_store():
 
 
 async def _populate_vector_store():
-    store = VectorStore()
+    store = VectorStore.from_context(context.vector_store)
     gdocs = GoogleDocsAPI()
     # PRD for "Generative AI V1: Creatives Builder"
     file_id = "10G2ztvu5cCOjgRShsuNCeqsuWxiyMG3Q1P9hDgkdxos"
     prd = gdocs.extract_data(file_id)
-    # Store in vector DB
-
-    for i, row in enumerate(prd):
-        chunk_id = f"{file_id}_chunk_{i}"
-        doc = {
-            "id": chunk_id,
+    # Store in vector DB, unchanged chunks of a previous run are skipped
+    docs = (
+        {
+            "id": f"{file_id}_chunk_{i}",
             "text": row,
             "metadata": {
-                "document_id": chunk_id,
+                "document_id": f"{file_id}_chunk_{i}",
                 "document_source": "prd",
                 "document_title": "PRD: Generative AI V1: Creatives Builder",
             },
         }
-        store.add_documents("gdrive", [doc])
+        for i, row in enumerate(prd)
+    )
+    print(store.ingest("gdrive", docs))
 
 
 async def test_gdocs_extraction():
-    store = VectorStore()
+    # The embedding model is shared, a new store does not load it again
+    store = VectorStore.from_context(context.vector_store)
 
     if not store.has_collection("gdrive"):
         await _populate_vector_store()
@@ -154,6 +156,154 @@ async def test_slack_agent_dm():
     print("Slack DM test result:", result.final_output)
 
 
+async def test_slack_history():
+    """Ingest the configured Slack channels and search them"""
+    store = VectorStore()
+    results = await ingest_slack_history(context.slack, store)
+    print("Documents upserted per channel:", results)
+
+    query = "What did we decide about the release?"
+    for res in store.search(query, source="slack", top_k=3):
+        print(
+            f"#{res['metadata'].get('channel_name')} {res['id']}: {res['text'][:200]}"
+        )
+
+
+def test_db_benchmark(
+    readers: int = 8, writers: int = 2, seconds: float = 5.0, directory_size: int = 5000
+):
+    """Mixed read/write load on a scratch database: name lookups while syncs write"""
+    import os
+    import random
+    import tempfile
+    import threading
+    import time
+
+    from sa_assistant import db
+    from sa_assistant.integrations.slack import SlackChat
+    from sa_assistant.tools.slack import fetch_chat, save_conversations
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db.get_engine(f"sqlite:///{path}")
+    chats = [
+        SlackChat(id=f"U{i}", name=f"user{i}", real_name=f"User {i}")
+        for i in range(directory_size)
+    ]
+    save_conversations(chats)
+
+    latencies = {"read": [], "write": []}
+    errors = []
+    deadline = time.monotonic() + seconds
+
+    def run(kind):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                if kind == "read":
+                    fetch_chat(f"user{random.randrange(directory_size)}")
+                else:
+                    save_conversations(random.sample(chats, 100))
+            except Exception as e:
+                errors.append(e)
+                continue
+            latencies[kind].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=run, args=("read",)) for _ in range(readers)]
+    threads += [threading.Thread(target=run, args=("write",)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for kind, values in latencies.items():
+        values.sort()
+        if not values:
+            print(f"{kind}: no operations completed")
+            continue
+        p50 = values[len(values) // 2] * 1000
+        p99 = values[int(len(values) * 0.99)] * 1000
+        print(
+            f"{kind}: {len(values) / seconds:.0f} ops/s, "
+            f"p50 {p50:.2f} ms, p99 {p99:.2f} ms"
+        )
+    print(f"errors: {len(errors)}", {type(e).__name__ for e in errors})
+
+
+def test_ingest_benchmark(chunks: int = 2000, batch_size: int = 64):
+    """Ingestion throughput on a scratch store: first ingest, then an unchanged re-ingest"""
+    import random
+    import tempfile
+
+    words = "campaign audience bid creative budget pacing report segment".split()
+    docs = [
+        {
+            "id": f"chunk_{i}",
+            "text": " ".join(random.choices(words, k=60)),
+            "metadata": {"document_id": f"doc_{i // 100}"},
+        }
+        for i in range(chunks)
+    ]
+
+    store = VectorStore(persist_directory=tempfile.mkdtemp())
+    for run in ("first ingest", "re-ingest"):
+        stats = store.ingest("benchmark", iter(docs), batch_size=batch_size)
+        print(
+            f"{run}: {stats['seen'] / stats['seconds']:.0f} chunks/s "
+            f"({stats['written']} written, {stats['skipped']} skipped)"
+        )
+
+
+async def test_load(
+    url: str = "http://127.0.0.1:8000/mcp",
+    clients: int = 10,
+    requests: int = 20,
+    tool: str | None = None,
+    request: str = "What are my meetings today?",
+):
+    """
+    Concurrent MCP clients against a server started with
+    `python server.py --transport streamable-http`. Lists the tools by default,
+    which measures the transport alone, or calls the given tool.
+    """
+    import time
+
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    latencies = []
+    errors = []
+
+    async def client():
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    try:
+                        if tool:
+                            await session.call_tool(tool, {"request": request})
+                        else:
+                            await session.list_tools()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(
+            f"{clients} clients: {len(latencies) / elapsed:.1f} calls/s, "
+            f"p50 {p50:.1f} ms, p99 {p99:.1f} ms"
+        )
+    print(f"errors: {len(errors)}", {type(e).__name__ for e in errors})
+
+
 if __name__ == "__main__":
     import sys
 
@@ -167,6 +317,22 @@ if __name__ == "__main__":
             asyncio.run(main())
         elif test_name == "gdocs":
             asyncio.run(test_gdocs_extraction())
+        elif test_name == "slack-history":
+            asyncio.run(test_slack_history())
+        elif test_name == "db-bench":
+            test_db_benchmark()
+        elif test_name == "ingest-bench":
+            test_ingest_benchmark()
+        elif test_name == "load":
+            # python test.py load [url] [clients] [requests] [tool]
+            args = sys.argv[2:]
+            asyncio.run(
+                test_load(
+                    *args[:1],
+                    *(int(a) for a in args[1:3]),
+                    *args[3:4],
+                )
+            )
         else:
             print("Available tests: slack, slack-dm, jira")
     else: